@@ -0,0 +1,188 @@
+# Автопилот змейки: сам выбирает направление на каждом ходу Engine.
+# Для каждого уровня один раз строится граф клеток с переходом через края, а для каждой клетки
+# яблока - поле расстояний до яблока по уровню без змейки (BFS только по стенам).
+# Поле кэшируется и на каждом ходу служит точной эвристикой A* от головы к яблоку, поэтому поиск
+# с учётом тела обходит только места, где путь перекрывает змейка, а не всё поле заново.
+# Само поле при движении тела не меняется: змейку учитывает только A*.
+# A* раскрывает ограниченное число клеток: около расстояния до яблока и половины длины змейки.
+# Перед ходом проверяется, что после него голове хватит места, иначе выбирается самый просторный ход;
+# место за всеми возможными ходами считается одним поиском в ширину на ход
+import heapq
+from collections import OrderedDict, deque
+
+FIELDS_CACHE_SIZE = 16  # полей расстояний на уровень, по одному на клетку яблока
+LEVELS_CACHE_SIZE = 8  # уровней с построенными графами
+PATH_SLACK = 100  # сколько клеток A* может раскрыть сверх расстояния до яблока и половины длины змейки
+UNREACHABLE = -1
+
+level_graphs = OrderedDict()  # (ширина, высота, стены) -> LevelGraph
+
+
+class LevelGraph:
+    # клетки уровня пронумерованы i = y * width + x
+    def __init__(self, level):
+        self.width = len(level[0])
+        self.height = len(level)
+        width, height = self.width, self.height
+        self.cells = [(x, y) for y in range(height) for x in range(width)]
+        self.walls = [level[y][x] == '#' for y in range(height) for x in range(width)]
+        # соседи клетки по направлениям UP, RIGHT, DOWN, LEFT, как в build_neighbors
+        self.neighbors = [(((y - 1) % height) * width + x, y * width + (x + 1) % width,
+                           ((y + 1) % height) * width + x, y * width + (x - 1) % width)
+                          for y in range(height) for x in range(width)]
+        self.fields = OrderedDict()  # клетка яблока -> поле расстояний
+
+    def distance_field(self, target):
+        # расстояния от всех клеток до target по уровню без змейки
+        if target in self.fields:
+            self.fields.move_to_end(target)
+            return self.fields[target]
+        field = [UNREACHABLE] * len(self.cells)
+        start = target[1] * self.width + target[0]
+        field[start] = 0
+        queue = deque([start])
+        walls = self.walls
+        neighbors = self.neighbors
+        while queue:
+            cell = queue.popleft()
+            distance = field[cell] + 1
+            for neighbor in neighbors[cell]:
+                if field[neighbor] == UNREACHABLE and not walls[neighbor]:
+                    field[neighbor] = distance
+                    queue.append(neighbor)
+        self.fields[target] = field
+        if len(self.fields) > FIELDS_CACHE_SIZE:
+            self.fields.popitem(last=False)
+        return field
+
+
+def level_graph(level):
+    # граф зависит только от стен, поэтому общий для всех игр на одном уровне
+    key = (len(level[0]), len(level), ''.join(''.join('#' if cell == '#' else '.' for cell in row) for row in level))
+    if key in level_graphs:
+        level_graphs.move_to_end(key)
+        return level_graphs[key]
+    graph = LevelGraph(level)
+    level_graphs[key] = graph
+    if len(level_graphs) > LEVELS_CACHE_SIZE:
+        level_graphs.popitem(last=False)
+    return graph
+
+
+class Autopilot:
+    def __init__(self):
+        self.level = None  # сетка игры, для которой найден self.graph
+        self.graph = None
+
+    def choose(self, game):
+        # направление для следующего хода game или None, если ехать прямо некуда и всё равно
+        if game.level is not self.level:
+            # Engine.reset копирует уровень, граф ищется по стенам в кэше
+            self.level = game.level
+            self.graph = level_graph(game.level)
+        graph = self.graph
+        snake = game.snake
+        occupied = snake.occupied
+        cells = graph.cells
+        walls = graph.walls
+        head_x, head_y = snake.snake_coords[-1]
+        head = head_y * graph.width + head_x
+        backwards = (snake.direction + 2) % 4
+        moves = [direction for direction in range(4) if direction != backwards and
+                 not walls[graph.neighbors[head][direction]] and
+                 cells[graph.neighbors[head][direction]] not in occupied]
+        if not moves:
+            return None
+        length = len(snake.snake_coords)
+        spaces = self.spaces([graph.neighbors[head][direction] for direction in moves], occupied, length)
+        if game.apple is not None:
+            field = graph.distance_field(game.apple)
+            direction = self.path_start(head, field, occupied, field[head] + length // 2 + PATH_SLACK)
+            if direction in moves and spaces[graph.neighbors[head][direction]] >= length:
+                return direction
+        else:
+            field = None
+        # к яблоку не пройти безопасно: самый просторный ход, при равенстве - ближе к яблоку
+        return max(moves, key=lambda direction: (
+            spaces[graph.neighbors[head][direction]],
+            -self.distance(field, graph.neighbors[head][direction])))
+
+    def distance(self, field, cell):
+        # расстояние до яблока по полю, клетки, откуда яблоко не достать, - дальше любых достижимых
+        if field is None or field[cell] == UNREACHABLE:
+            return len(self.graph.cells)
+        return field[cell]
+
+    def path_start(self, head, field, occupied, budget):
+        # A* от головы до яблока в обход стен и тела, field - расстояния без тела (эвристика);
+        # возвращает направление первого шага или None. Раскрывается не больше budget клеток:
+        # если тело отрезало яблоко или путь в обход слишком длинный, поиск обошёл бы всю область,
+        # а ход всё равно выберется по месту и полю расстояний
+        if field[head] == UNREACHABLE:
+            return None
+        graph = self.graph
+        cells = graph.cells
+        walls = graph.walls
+        neighbors = graph.neighbors
+        first_steps = {head: None}
+        costs = {head: 0}
+        # при равной оценке первой раскрывается клетка дальше от головы, с точной эвристикой
+        # поиск идёт прямо вдоль кратчайшего пути и не перебирает все равные пути
+        heap = [(field[head], 0, head)]
+        while heap:
+            budget -= 1
+            if budget < 0:
+                return None
+            _, cost, cell = heapq.heappop(heap)
+            cost = -cost
+            if field[cell] == 0:
+                return first_steps[cell]
+            if cost > costs[cell]:
+                continue
+            for direction, neighbor in enumerate(neighbors[cell]):
+                if walls[neighbor] or cells[neighbor] in occupied or \
+                        (neighbor in costs and costs[neighbor] <= cost + 1):
+                    continue
+                costs[neighbor] = cost + 1
+                first_steps[neighbor] = direction if cell == head else first_steps[cell]
+                heapq.heappush(heap, (cost + 1 + field[neighbor], -cost - 1, neighbor))
+        return None
+
+    def spaces(self, starts, occupied, limit):
+        # сколько свободных клеток достижимо из каждой клетки starts, не больше limit (или чуть больше).
+        # Поиск в ширину идёт сразу из всех starts, клетка помечается областью, которая до неё дошла,
+        # встретившиеся области сливаются в одну, и область перестаёт расти, набрав limit клеток.
+        # Поэтому ходы в одну и ту же область не обходят её каждый заново
+        graph = self.graph
+        cells = graph.cells
+        walls = graph.walls
+        neighbors = graph.neighbors
+        parents = list(range(len(starts)))  # области, слитые с другими, указывают на общую
+        sizes = [1] * len(starts)
+        labels = {}  # клетка -> номер области, которая её нашла
+        queue = deque()
+        for label, start in enumerate(starts):
+            labels[start] = label
+            queue.append(start)
+
+        def root(label):
+            while parents[label] != label:
+                label = parents[label]
+            return label
+
+        while queue:
+            cell = queue.popleft()
+            label = root(labels[cell])
+            if sizes[label] >= limit:
+                continue
+            for neighbor in neighbors[cell]:
+                if neighbor in labels:
+                    other = root(labels[neighbor])
+                    if other != label:
+                        parents[other] = label
+                        sizes[label] += sizes[other]
+                elif not walls[neighbor] and cells[neighbor] not in occupied:
+                    labels[neighbor] = label
+                    sizes[label] += 1
+                    queue.append(neighbor)
+        return {start: sizes[root(label)] for label, start in enumerate(starts)}
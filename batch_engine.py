@@ -0,0 +1,160 @@
+# Векторизованная версия engine.py: N игр на одном уровне выполняются одновременно на массивах NumPy.
+# Правила те же, что у engine.Snake и engine.create_apple: переход через края поля,
+# проигрыш при ударе о стену или о себя, новое яблоко в случайной свободной клетке
+import numpy as np
+
+from engine import DOWN, LEFT, RIGHT, START_SNAKE_COORDS, UP, apple_area
+
+EMPTY, WALL, SNAKE, APPLE = range(4)  # значения клеток в полях
+CONTINUE, GAME_OVER, WIN = range(3)  # статусы игр после хода
+APPLE_TRIES = 8  # попыток выбрать свободную клетку случайно, прежде чем перебирать все свободные клетки
+
+# константы генератора splitmix64
+GOLDEN_GAMMA = np.uint64(0x9E3779B97F4A7C15)
+MIX_1 = np.uint64(0xBF58476D1CE4E5B9)
+MIX_2 = np.uint64(0x94D049BB133111EB)
+
+
+def neighbor_table(height, width):
+    # соседи каждой клетки по направлениям с переходом через края поля: table[cell, direction] -> cell
+    cells = np.arange(height * width)
+    y, x = np.divmod(cells, width)
+    table = np.empty((height * width, 4), dtype=np.int64)
+    table[:, UP] = (y - 1) % height * width + x
+    table[:, RIGHT] = y * width + (x + 1) % width
+    table[:, DOWN] = (y + 1) % height * width + x
+    table[:, LEFT] = y * width + (x - 1) % width
+    return table
+
+
+class BatchEngine:
+    # Поля хранятся как массив (N, высота * ширина) uint8, тело каждой змейки - кольцевой буфер
+    # номеров клеток с указателями на голову и хвост. У каждой игры свой поток случайных чисел,
+    # поэтому результат игры не зависит от того, сколько игр идёт рядом
+    def __init__(self, level, games_count, seed=None, snake_coords=None, auto_reset=True):
+        self.height = len(level)
+        self.width = len(level[0])
+        self.size = self.height * self.width
+        self.games_count = games_count
+        self.auto_reset = auto_reset
+        if snake_coords is None:
+            snake_coords = START_SNAKE_COORDS
+        self.start_cells = np.array([y * self.width + x for x, y in snake_coords], dtype=np.int64)
+        codes = {'#': WALL, '@': APPLE}
+        # клетки закрытых карманов, куда змейке не доползти, считаются стенами, чтобы там не появлялись яблоки
+        area = apple_area(level, snake_coords)
+        self.start_board = np.array([codes.get(cell, EMPTY) if (x, y) in area else WALL
+                                     for y, row in enumerate(level) for x, cell in enumerate(row)], dtype=np.uint8)
+        self.start_board[self.start_cells] = SNAKE
+        self.neighbors = neighbor_table(self.height, self.width)
+
+        self.games = np.arange(games_count)
+        self.boards = np.empty((games_count, self.size), dtype=np.uint8)
+        self.body = np.zeros((games_count, self.size), dtype=np.int32 if self.size < 2 ** 31 else np.int64)
+        self.head_ptr = np.zeros(games_count, dtype=np.int64)
+        self.tail_ptr = np.zeros(games_count, dtype=np.int64)
+        self.length = np.zeros(games_count, dtype=np.int64)
+        self.direction = np.zeros(games_count, dtype=np.int64)
+        self.score = np.zeros(games_count, dtype=np.int64)
+        self.ticks = np.zeros(games_count, dtype=np.int64)
+        self.status = np.zeros(games_count, dtype=np.int8)
+        # счёт и длительность игр, закончившихся на последнем ходу (до автоматического перезапуска)
+        self.final_score = np.zeros(games_count, dtype=np.int64)
+        self.final_ticks = np.zeros(games_count, dtype=np.int64)
+        self.rng_state = np.random.SeedSequence(seed).generate_state(games_count, dtype=np.uint64)
+        self.reset()
+
+    def reset(self, games=None):
+        games = self.games if games is None else np.asarray(games, dtype=np.int64)
+        start_length = len(self.start_cells)
+        self.boards[games] = self.start_board
+        self.body[games, :start_length] = self.start_cells
+        self.tail_ptr[games] = 0
+        self.head_ptr[games] = start_length - 1
+        self.length[games] = start_length
+        self.direction[games] = RIGHT
+        self.score[games] = 0
+        self.ticks[games] = 0
+        self.status[games] = CONTINUE
+        won = self.spawn_apples(games)
+        self.status[won] = WIN
+
+    def random_values(self, games):
+        # следующий шаг splitmix64 для каждой из переданных игр
+        state = self.rng_state[games] + GOLDEN_GAMMA
+        self.rng_state[games] = state
+        z = (state ^ (state >> np.uint64(30))) * MIX_1
+        z = (z ^ (z >> np.uint64(27))) * MIX_2
+        return z ^ (z >> np.uint64(31))
+
+    def spawn_apples(self, games):
+        # ставит по яблоку в каждую переданную игру, возвращает игры, в которых не осталось места (победа)
+        pending = games
+        for _ in range(APPLE_TRIES):
+            if not pending.size:
+                break
+            cells = (self.random_values(pending) % np.uint64(self.size)).astype(np.int64)
+            free = self.boards[pending, cells] == EMPTY
+            self.boards[pending[free], cells[free]] = APPLE
+            pending = pending[~free]
+        won = []
+        for game in pending:
+            # поле почти заполнено, выбираем среди всех свободных клеток
+            free_cells = np.flatnonzero(self.boards[game] == EMPTY)
+            if not free_cells.size:
+                won.append(game)
+                continue
+            value = self.random_values(np.array([game]))[0]
+            self.boards[game, free_cells[int(value % np.uint64(free_cells.size))]] = APPLE
+        return np.array(won, dtype=np.int64)
+
+    def heads(self):
+        return self.body[self.games, self.head_ptr]
+
+    def step(self, actions=None):
+        # actions - массив направлений длины N (-1 - ехать прямо) или None.
+        # Возвращает (головы змеек, награды, статусы); законченные игры перезапускаются, если включён auto_reset
+        active = self.status == CONTINUE
+        if actions is not None:
+            actions = np.asarray(actions)
+            turn = active & (actions >= 0) & (actions != (self.direction + 2) % 4)
+            self.direction = np.where(turn, actions, self.direction)
+        games = self.games[active]
+        heads = self.body[games, self.head_ptr[games]]
+        new_heads = self.neighbors[heads, self.direction[games]]
+        target = self.boards[games, new_heads]
+        dead = (target == WALL) | (target == SNAKE)
+        ate = target == APPLE
+        self.ticks[games] += 1
+
+        moving = games[~dead]
+        moving_heads = new_heads[~dead]
+        self.head_ptr[moving] = (self.head_ptr[moving] + 1) % self.size
+        self.body[moving, self.head_ptr[moving]] = moving_heads
+        self.boards[moving, moving_heads] = SNAKE
+
+        shrinking = games[~dead & ~ate]
+        tails = self.body[shrinking, self.tail_ptr[shrinking]]
+        self.boards[shrinking, tails] = EMPTY
+        self.tail_ptr[shrinking] = (self.tail_ptr[shrinking] + 1) % self.size
+
+        eaten = games[ate]
+        self.score[eaten] += 1
+        self.length[eaten] += 1
+        won = self.spawn_apples(eaten)
+
+        rewards = np.zeros(self.games_count, dtype=np.float32)
+        rewards[eaten] = 1
+        rewards[games[dead]] = -1
+        statuses = np.full(self.games_count, CONTINUE, dtype=np.int8)
+        statuses[~active] = self.status[~active]
+        statuses[games[dead]] = GAME_OVER
+        statuses[won] = WIN
+        self.status = statuses.copy()
+
+        finished = self.games[active & (statuses != CONTINUE)]
+        self.final_score[finished] = self.score[finished]
+        self.final_ticks[finished] = self.ticks[finished]
+        if self.auto_reset and finished.size:
+            self.reset(finished)
+        return self.heads(), rewards, statuses
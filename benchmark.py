@@ -0,0 +1,352 @@
+# Замеры производительности горячих мест игры без окна и звука (SDL_VIDEODRIVER/SDL_AUDIODRIVER=dummy).
+# Результаты сохраняются в JSON, с --compare сравниваются с прошлым запуском:
+#   python benchmark.py --output bench.json
+#   python benchmark.py --compare bench.json --threshold 1.25
+# Скрипт завершается с кодом 1, если какой-то замер стал медленнее прошлого больше чем в threshold раз
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+os.chdir(os.path.dirname(os.path.abspath(__file__)))  # main.py загружает data/ по относительным путям
+
+import pygame  # noqa: E402
+
+import main  # noqa: E402
+from autopilot import Autopilot  # noqa: E402
+from engine import DOWN, RIGHT, Engine, Snake, build_neighbors, create_apple, load_level, \
+    load_level_and_spawn  # noqa: E402
+from evaluate_levels import greedy_policy  # noqa: E402
+from particles import ParticleSystem  # noqa: E402
+import replay  # noqa: E402
+from replay import Recorder, Replay  # noqa: E402
+
+SNAKE_LENGTHS = [2, 10, 100, 1000, 5000]
+BIG_BOARD_SIDE = 100  # поле без стен для длинных змеек
+AUTOPILOT_LONG_SNAKE = 150  # длина змейки, с которой замеряется autopilot_decision_30_long
+
+
+def measure(func, repeat):
+    # время одного вызова в микросекундах и прирост числа выделенных блоков памяти на вызов
+    times = []
+    blocks_before = sys.getallocatedblocks()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    blocks = (sys.getallocatedblocks() - blocks_before) / repeat
+    return summary(times, blocks)
+
+
+def summary(times, blocks):
+    times = sorted(times)
+    return {'calls': len(times),
+            'mean_us': sum(times) / len(times) * 1e6,
+            'median_us': times[len(times) // 2] * 1e6,
+            'p95_us': times[min(len(times) - 1, int(len(times) * 0.95))] * 1e6,
+            'min_us': times[0] * 1e6,
+            'allocated_blocks': blocks}
+
+
+def empty_level(width, height):
+    return [['.'] * width for _ in range(height)]
+
+
+def path_direction(k, width):
+    # змейка ползёт по полю строками: вправо, в конце строки вниз, такой путь не пересекает сам себя
+    return DOWN if (k + 1) % width == 0 else RIGHT
+
+
+def long_snake(level, length):
+    # змейка длины length, уложенная по пути path_direction, и номер клетки пути под её головой
+    neighbors = build_neighbors(level)
+    width = len(level[0])
+    coords = [(0, 0)]
+    for k in range(length - 1):
+        x, y = coords[-1]
+        coords.append(neighbors[y][x][path_direction(k, width)])
+    snake = Snake(coords, level)
+    return snake, length - 1
+
+
+def bench_snake_move(length, repeat):
+    level = empty_level(BIG_BOARD_SIDE, BIG_BOARD_SIDE)
+    snake, head_index = long_snake(level, length)
+    position = [head_index]
+
+    def move():
+        snake.direction = path_direction(position[0], BIG_BOARD_SIDE)
+        snake.move(level)
+        position[0] += 1
+
+    return measure(move, repeat)
+
+
+def bench_create_apple(free_count, repeat):
+    side = BIG_BOARD_SIDE if free_count else 30
+    level = empty_level(side, side)
+    if free_count:
+        snake, _ = long_snake(level, side * side - free_count)
+    else:
+        snake = Snake([(0, 0), (1, 0)], level)
+
+    def spawn():
+        x, y = create_apple(level, snake)
+        # возвращаем клетку, чтобы следующий вызов выбирал из того же числа клеток
+        level[y][x] = '.'
+        snake.free_cells.add((x, y))
+
+    return measure(spawn, repeat)
+
+
+def bench_snake_render(screen, length, repeat):
+    # ход длинной змейки с обновлением изображений кусков и перерисовкой изменившихся клеток
+    level = empty_level(BIG_BOARD_SIDE, BIG_BOARD_SIDE)
+    snake, head_index = long_snake(level, length)
+    renderer = main.LevelRenderer(screen, level)
+    renderer.follow(snake.snake_coords[-1])
+    renderer.draw_level(level, snake)
+    position = [head_index]
+
+    def move():
+        snake.direction = path_direction(position[0], BIG_BOARD_SIDE)
+        snake.move(level)
+        position[0] += 1
+        renderer.move_parts(snake)
+        if renderer.follow(snake.snake_coords[-1]):
+            renderer.draw_level(level, snake)
+        else:
+            renderer.draw_cells(level, snake, snake.changed_cells)
+
+    return measure(move, repeat)
+
+
+def bench_renderer(screen, repeat):
+    level = empty_level(30, 30)
+    game = Engine(level, seed=0)
+    game.snake, _ = long_snake(game.level, 400)
+    renderer = main.LevelRenderer(screen, game.level)
+    results = {'renderer_init': measure(lambda: main.LevelRenderer(screen, game.level), max(1, repeat // 10)),
+               'renderer_draw_level': measure(lambda: renderer.draw_level(game.level, game.snake), repeat)}
+    cells = list(game.snake.snake_coords)[-3:] + [game.snake.snake_coords[0], (20, 20)]
+    results['renderer_draw_cells'] = measure(lambda: renderer.draw_cells(game.level, game.snake, cells), repeat)
+    # большое поле: в окне видна только часть уровня, фон рисуется кусками
+    big_game = Engine(empty_level(500, 500), seed=0)
+    big_renderer = main.LevelRenderer(screen, big_game.level)
+    big_renderer.follow((250, 250))
+    results['renderer_draw_level_500'] = measure(lambda: big_renderer.draw_level(big_game.level, big_game.snake), repeat)
+    return results
+
+
+def bench_particles(screen, count, repeat):
+    # кадр с count живыми частицами: движение, удаление вылетевших и рисование
+    system = ParticleSystem(pygame.Rect(0, 0, main.WIDTH, main.HEIGHT - 50), seed=0)
+
+    def frame():
+        if len(system) < count:
+            for i in range(len(system), count, 100):
+                system.spawn(50 + i % 650, 50 + i // 650 % 650, (240, 0, 0), 100, lifetime=(60, 60))
+        system.update(1 / main.RENDER_FPS)
+        system.draw(screen)
+
+    return measure(frame, repeat)
+
+
+def bench_play_ticks(ticks):
+    # приложение целиком: меню, выбор сложности и уровня, затем ticks кадров с поворотами и перезапусками,
+    # выход в меню и остановка, когда сценарий закончится
+    def click(x, y):
+        return [pygame.event.Event(pygame.MOUSEBUTTONDOWN, pos=(x, y), button=1)]
+
+    def key(k):
+        return [pygame.event.Event(pygame.KEYDOWN, key=k, mod=0, unicode='')]
+
+    turns = [pygame.K_DOWN, pygame.K_RIGHT, pygame.K_UP, pygame.K_RIGHT]
+    script = [click(300, 300), click(300, 300), click(300, 740)]
+    for i in range(ticks):
+        if i % 150 == 149:
+            script.append(key(pygame.K_r))
+        elif i % 12 == 0:
+            script.append(key(turns[i // 12 % len(turns)]))
+        else:
+            script.append([])
+    script.append(key(pygame.K_ESCAPE))
+    script.reverse()
+    tick_times = []
+    tick_blocks = []
+
+    class ScriptedClock:
+        def tick(self, *args):
+            tick_times.append(time.perf_counter())
+            tick_blocks.append(sys.getallocatedblocks())
+            return 1000 // main.RENDER_FPS  # время кадра при частоте отрисовки, иначе ходы змейки не делаются
+
+    class ScriptEnd(Exception):
+        pass
+
+    def scripted_events(*args, **kwargs):
+        pygame.event.pump()
+        if not script:
+            raise ScriptEnd
+        return script.pop()
+
+    saved = (pygame.event.get, pygame.event.wait, pygame.time.Clock, main.start_music, main.records,
+             replay.REPLAYS_DIR, main.PROFILER_CSV)
+    pygame.event.get = scripted_events
+    pygame.event.wait = lambda *args, **kwargs: pygame.event.Event(pygame.NOEVENT)  # меню не ждут событий
+    pygame.time.Clock = ScriptedClock
+    main.start_music = lambda *args, **kwargs: None  # музыка в замерах не нужна
+    with tempfile.TemporaryDirectory() as temp_dir:
+        main.records = main.Records(os.path.join(temp_dir, 'stats.txt'))  # настоящие рекорды не трогаем
+        replay.REPLAYS_DIR = temp_dir  # и записи игр тоже
+        main.PROFILER_CSV = os.path.join(temp_dir, main.PROFILER_CSV)  # и время кадров
+        try:
+            main.App().run()
+        except ScriptEnd:
+            pass
+        finally:
+            (pygame.event.get, pygame.event.wait, pygame.time.Clock, main.start_music, main.records,
+             replay.REPLAYS_DIR, main.PROFILER_CSV) = saved
+    # экраны меню ждут событий без часов, поэтому все тики приходятся на игру
+    game_times = [b - a for a, b in zip(tick_times, tick_times[1:])]
+    game_blocks = [b - a for a, b in zip(tick_blocks, tick_blocks[1:])]
+    return summary(game_times, sum(game_blocks) / len(game_blocks))
+
+
+def bench_first_frame(repeat):
+    # холодный старт в отдельном процессе: от запуска интерпретатора до показа главного меню,
+    # вместе с запуском Python и импортом всех модулей
+    code = ('import time, pygame, main; pygame.init(); '
+            'main.show_first_frame(pygame.display.set_mode((main.WIDTH, main.HEIGHT))); '
+            # момент показа меню по общим часам: show_first_frame после показа ещё загружает частицы
+            'shown = time.time() - (time.perf_counter() - main.start_time - main.first_frame_time); '
+            'print("first_frame", shown, flush=True); import os; os._exit(0)')
+    times = []
+    for _ in range(repeat):
+        start = time.time()  # часы, общие для обоих процессов
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+        times.append(float(output.split('first_frame')[-1]) - start)
+    return summary(times, 0)
+
+
+def bench_replay(repeat):
+    # разбор и воспроизведение записи партии, сыгранной жадной стратегией
+    level, snake_coords = load_level_and_spawn('level1_0.txt')
+    game = Engine(level, 0, snake_coords)
+    recorder = Recorder(level, 0, snake_coords)
+    rng = random.Random(0)
+    while game.status == 'continue' and game.ticks < 2000:
+        action = greedy_policy(game, rng)
+        recorder.record(action)
+        game.step(action)
+    data = recorder.encode(game)
+    return measure(lambda: Replay(data).play(), repeat)
+
+
+def bench_batch_engine(repeat):
+    try:
+        import numpy as np
+        from batch_engine import BatchEngine
+    except ImportError:
+        return None
+    level, snake_coords = load_level_and_spawn('level1_0.txt')
+    batch = BatchEngine(level, 1024, seed=0, snake_coords=snake_coords)
+    actions = np.random.default_rng(0).integers(-1, 4, size=1024)
+    return measure(lambda: batch.step(actions), repeat)
+
+
+def bench_autopilot(level, decisions, snake_coords=None, min_length=0):
+    # решение автопилота в партии: поле расстояний считается при появлении яблока, дальше A* по нему.
+    # С min_length замеряются только ходы змейки не короче min_length: автопилот сам доращивает её,
+    # место для головы ищется на глубину длины змейки, поэтому длинная змейка - худший случай
+    game = Engine(level, 0, snake_coords)
+    pilot = Autopilot()
+    times = []
+    games = 1
+    blocks_before = sys.getallocatedblocks()
+    while len(times) < decisions:
+        timed = len(game.snake.snake_coords) >= min_length
+        start = time.perf_counter()
+        action = pilot.choose(game)
+        if timed:
+            times.append(time.perf_counter() - start)
+        if game.step(action)[2] != 'continue':
+            game.reset(level, games, snake_coords)
+            games += 1
+    return summary(times, (sys.getallocatedblocks() - blocks_before) / decisions)
+
+
+def run(quick):
+    repeat = 200 if quick else 2000
+    pygame.init()
+    screen = pygame.display.set_mode((main.WIDTH, main.HEIGHT))
+    main.show_first_frame(screen)  # загружает тему по умолчанию
+    results = {}
+    for length in SNAKE_LENGTHS:
+        results[f'snake_move_{length}'] = bench_snake_move(length, repeat)
+    results['create_apple_empty'] = bench_create_apple(0, repeat)
+    results['create_apple_nearly_full'] = bench_create_apple(10, repeat)
+    results['load_level'] = measure(lambda: load_level('level3_5.txt'), repeat // 10)
+    results.update(bench_renderer(screen, repeat // 10))
+    results['snake_render_5000'] = bench_snake_render(screen, 5000, repeat)
+    results['particles_20000'] = bench_particles(screen, 20000, repeat // 10)
+    results['replay_playback'] = bench_replay(max(1, repeat // 20))
+    level, snake_coords = load_level_and_spawn('level1_0.txt')
+    results['autopilot_decision_30'] = bench_autopilot(level, repeat, snake_coords)
+    results['autopilot_decision_30_long'] = bench_autopilot(level, repeat, snake_coords, AUTOPILOT_LONG_SNAKE)
+    results['autopilot_decision_200'] = bench_autopilot(empty_level(200, 200), repeat // 2)
+    batch = bench_batch_engine(repeat // 10)
+    if batch is not None:
+        results['batch_engine_step_1024'] = batch
+    results['play_tick'] = bench_play_ticks(100 if quick else 600)
+    results['time_to_first_frame'] = bench_first_frame(3 if quick else 10)
+    return results
+
+
+def compare(results, baseline, threshold):
+    # список замеров, которые стали медленнее baseline больше чем в threshold раз
+    regressions = []
+    for name, result in results.items():
+        old = baseline.get(name)
+        if old and result['mean_us'] > old['mean_us'] * threshold:
+            regressions.append((name, old['mean_us'], result['mean_us']))
+    return regressions
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description='Замеры производительности игры')
+    parser.add_argument('--output', help='куда сохранить результаты в JSON')
+    parser.add_argument('--compare', help='JSON прошлого запуска для сравнения')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='во сколько раз замер может стать медленнее, прежде чем это считается регрессией')
+    parser.add_argument('--quick', action='store_true', help='меньше повторов, для быстрой проверки')
+    args = parser.parse_args()
+
+    results = run(args.quick)
+    print(f'{"замер":<28} {"среднее, мкс":>13} {"медиана":>10} {"p95":>10} {"блоков/вызов":>13}')
+    for name, result in results.items():
+        print(f'{name:<28} {result["mean_us"]:>13.1f} {result["median_us"]:>10.1f} '
+              f'{result["p95_us"]:>10.1f} {result["allocated_blocks"]:>13.2f}')
+    if args.output:
+        with open(args.output, 'w', encoding='UTF-8') as file:
+            json.dump({'python': platform.python_version(), 'pygame': pygame.version.ver,
+                       'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'benchmarks': results}, file, indent=2)
+    if args.compare:
+        with open(args.compare, encoding='UTF-8') as file:
+            baseline = json.load(file)['benchmarks']
+        regressions = compare(results, baseline, args.threshold)
+        for name, old, new in regressions:
+            print(f'РЕГРЕССИЯ {name}: {old:.1f} -> {new:.1f} мкс')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main_cli()
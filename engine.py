@@ -0,0 +1,236 @@
+# Игровая логика змейки без pygame: уровень, движение, яблоки и победа/проигрыш.
+# Используется игрой в main.py, а также ботами и тестами, которым не нужны экран и звук
+import functools
+import hashlib
+import os
+import random
+from collections import OrderedDict, deque, namedtuple
+
+import level_pack
+
+UP, RIGHT, DOWN, LEFT = range(4)  # направления движения змейки
+DIRECTION_NAMES = ['up', 'right', 'down', 'left']
+START_SNAKE_COORDS = [(0, 0), (1, 0)]  # начальные координаты змейки, голова последняя
+
+NEIGHBOR_TABLES_KEPT = 8  # сколько таблиц соседей для разных размеров поля хранится в кэше
+APPLE_AREAS_KEPT = 16  # сколько уровней хранится в кэше областей для яблок
+
+State = namedtuple('State', ['head', 'direction', 'length', 'score', 'apple'])
+
+
+def load_level(filename):
+    return load_level_and_spawn(filename)[0]
+
+
+def load_level_and_spawn(filename):
+    # сетка уровня и начальные координаты змейки; уровень берётся из собранного пака,
+    # а если пака нет - из текстового файла
+    pack = level_pack.open_pack()
+    if pack is not None and filename in pack:
+        width, _ = pack.size(filename)
+        return pack.level(filename), spawn_snake_coords(pack.spawn(filename), width)
+    rows, spawn = level_pack.read_level_file(os.path.join(level_pack.LEVELS_DIR, filename))
+    return [list(row) for row in rows], spawn_snake_coords(spawn, len(rows[0]))
+
+
+def spawn_snake_coords(spawn, width):
+    # змейка из двух клеток: хвост в клетке появления, голова справа от него
+    x, y = spawn
+    return [(x, y), ((x + 1) % width, y)]
+
+
+def build_neighbors(level):
+    # таблица соседей клеток с переходом через края поля:
+    # neighbors[y][x][direction] -> координаты соседней клетки
+    return neighbor_table(len(level[0]), len(level))
+
+
+@functools.lru_cache(maxsize=NEIGHBOR_TABLES_KEPT)
+def neighbor_table(width, height):
+    # таблица зависит только от размеров поля, поэтому строится один раз на размер и общая для всех змеек;
+    # её нельзя менять
+    return [[((x, (y - 1) % height), ((x + 1) % width, y), (x, (y + 1) % height), ((x - 1) % width, y))
+             for x in range(width)] for y in range(height)]
+
+
+def level_hash(level, snake_coords):
+    # хэш содержимого уровня и начальных клеток змейки, по нему кэшируются результаты анализа уровня
+    digest = hashlib.sha1(f'{len(level[0])}x{len(level)} {[tuple(cell) for cell in snake_coords]}'.encode())
+    for row in level:
+        digest.update(''.join(row).encode('ascii'))
+    return digest.hexdigest()
+
+
+def reachable_cells(level, start):
+    # клетки без стен, до которых можно доползти из start с переходом через края поля
+    neighbors = build_neighbors(level)
+    cells = {start}
+    queue = deque([start])
+    while queue:
+        x, y = queue.popleft()
+        for neighbor_x, neighbor_y in neighbors[y][x]:
+            if (neighbor_x, neighbor_y) not in cells and level[neighbor_y][neighbor_x] != '#':
+                cells.add((neighbor_x, neighbor_y))
+                queue.append((neighbor_x, neighbor_y))
+    return cells
+
+
+apple_areas = OrderedDict()  # хэш уровня -> клетки, в которых может появиться яблоко
+
+
+def apple_area(level, snake_coords):
+    # клетки области, в которой появляется змейка: яблоко в закрытом кармане уровня не достать,
+    # поэтому оно появляется только здесь. Области считаются один раз на уровень
+    key = level_hash(level, snake_coords)
+    if key in apple_areas:
+        apple_areas.move_to_end(key)
+        return apple_areas[key]
+    area = frozenset(reachable_cells(level, tuple(snake_coords[-1])))
+    apple_areas[key] = area
+    if len(apple_areas) > APPLE_AREAS_KEPT:
+        apple_areas.popitem(last=False)
+    return area
+
+
+class FreeCells:
+    # свободные клетки поля: список клеток и позиция каждой клетки в нём,
+    # добавление, удаление (перестановкой с последней) и случайный выбор за O(1)
+    def __init__(self, cells):
+        self.cells = list(cells)
+        self.positions = {cell: i for i, cell in enumerate(self.cells)}
+
+    def __len__(self):
+        return len(self.cells)
+
+    def __contains__(self, cell):
+        return cell in self.positions
+
+    def add(self, cell):
+        if cell not in self.positions:
+            self.positions[cell] = len(self.cells)
+            self.cells.append(cell)
+
+    def remove(self, cell):
+        i = self.positions.pop(cell, None)
+        if i is None:
+            return
+        last = self.cells.pop()
+        if i < len(self.cells):
+            self.cells[i] = last
+            self.positions[last] = i
+
+    def choice(self, rng=random):
+        return rng.choice(self.cells)
+
+
+class Snake:
+    def __init__(self, snake_coords, level, area=None):
+        self.snake_coords = deque(snake_coords)  # хвост слева, голова справа
+        self.occupied = set(snake_coords)  # клетки, занятые змейкой
+        self.neighbors = build_neighbors(level)
+        # пустые клетки без змейки и яблок (только из area, если она задана), обновляются при каждом ходе
+        self.free_cells = FreeCells((x, y) for y in range(len(level)) for x in range(len(level[0]))
+                                    if level[y][x] == '.' and (x, y) not in self.occupied and
+                                    (area is None or (x, y) in area))
+        self.direction = RIGHT
+        self.score = 0
+        self.changed_cells = []  # клетки, изменившиеся за последний ход
+        self.previous_tail = None  # клетка, которую хвост освободил на последнем ходу
+
+    def change_direction(self, direction):
+        if (direction + 2) % 4 != self.direction:
+            self.direction = direction
+
+    def direction_to(self, cell, other):
+        # направление от клетки к соседней
+        return self.neighbors[cell[1]][cell[0]].index(other)
+
+    def move(self, level):
+        # возвращает 'game_over', 'apple' (съедено яблоко) или 'continue'
+        last_x, last_y = self.snake_coords[-1]
+        self.changed_cells = [(last_x, last_y)]
+        self.previous_tail = None
+        new_last_x, new_last_y = self.neighbors[last_y][last_x][self.direction]
+        if level[new_last_y][new_last_x] == '#' or (new_last_x, new_last_y) in self.occupied:
+            return 'game_over'
+        self.snake_coords.append((new_last_x, new_last_y))
+        self.occupied.add((new_last_x, new_last_y))
+        self.free_cells.remove((new_last_x, new_last_y))
+        self.changed_cells.append((new_last_x, new_last_y))
+        if level[new_last_y][new_last_x] != '@':
+            tail = self.snake_coords.popleft()
+            self.occupied.discard(tail)
+            self.free_cells.add(tail)
+            self.previous_tail = tail
+            self.changed_cells.append(tail)
+            self.changed_cells.append(self.snake_coords[0])
+            return 'continue'
+        self.score += 1
+        level[new_last_y][new_last_x] = '.'
+        return 'apple'
+
+
+def create_apple(level, snake, rng=random):
+    # Случайно выбираем одну из свободных клеток, возвращает её координаты или None, если места нет
+    free_cells = snake.free_cells
+    if not free_cells:
+        return None
+    apple_x, apple_y = free_cells.choice(rng)
+    free_cells.remove((apple_x, apple_y))
+    level[apple_y][apple_x] = '@'
+    snake.changed_cells.append((apple_x, apple_y))
+    return apple_x, apple_y
+
+
+class Engine:
+    # Один сеанс игры: reset() начинает игру на уровне, step() делает один ход.
+    # step возвращает (состояние, награда, статус), статус - 'continue', 'game_over' или 'win'
+    def __init__(self, level=None, seed=None, snake_coords=None):
+        self.level = None
+        self.snake = None
+        self.random = None
+        self.apple = None
+        self.status = 'continue'
+        self.ate_apple = False  # было ли съедено яблоко на последнем ходу
+        self.ticks = 0
+        if level is not None:
+            self.reset(level, seed, snake_coords)
+
+    def reset(self, level, seed=None, snake_coords=None):
+        # уровень копируется, поэтому исходную сетку можно переиспользовать между играми
+        self.level = [list(row) for row in level]
+        self.random = random.Random(seed)
+        if snake_coords is None:
+            snake_coords = START_SNAKE_COORDS
+        # яблоки появляются только там, куда змейка может доползти, и победа - когда там не осталось места
+        self.snake = Snake(snake_coords, self.level, apple_area(self.level, snake_coords))
+        self.ate_apple = False
+        self.ticks = 0
+        self.apple = create_apple(self.level, self.snake, self.random)
+        self.status = 'continue' if self.apple is not None else 'win'
+        return self.state()
+
+    def state(self):
+        snake = self.snake
+        return State(snake.snake_coords[-1], snake.direction, len(snake.snake_coords), snake.score, self.apple)
+
+    def step(self, action=None):
+        # action - новое направление (UP, RIGHT, DOWN, LEFT) или None, чтобы ехать прямо
+        if self.status != 'continue':
+            return self.state(), 0, self.status
+        snake = self.snake
+        if action is not None:
+            snake.change_direction(action)
+        self.ticks += 1
+        result = snake.move(self.level)
+        self.ate_apple = result == 'apple'
+        reward = 0
+        if result == 'game_over':
+            self.status = 'game_over'
+            reward = -1
+        elif self.ate_apple:
+            reward = 1
+            self.apple = create_apple(self.level, snake, self.random)
+            if self.apple is None:
+                self.status = 'win'  # победа если нет места для яблока
+        return self.state(), reward, self.status
@@ -0,0 +1,151 @@
+# Оценка сложности уровней: на каждом уровне из data/levels играется заданное число игр
+# встроенной стратегией, игры распределяются по процессам multiprocessing.
+# Запуск из корня проекта: python evaluate_levels.py --games 200 --policy greedy
+import argparse
+import multiprocessing
+import os
+import random
+import re
+import time
+
+from autopilot import Autopilot
+from engine import Engine, load_level_and_spawn
+
+DIFFICULTIES = {'1': 'easy', '2': 'normal', '3': 'hard'}
+LEVEL_FILE_RE = re.compile(r'level(\d)_(\d+)\.txt$')
+
+
+def random_policy(game, rng):
+    # едет прямо и иногда поворачивает в случайную сторону
+    if rng.random() < 0.2:
+        return rng.randrange(4)
+    return None
+
+
+def greedy_policy(game, rng):
+    # из безопасных направлений выбирает ближайшее к яблоку с учётом перехода через края
+    snake = game.snake
+    head_x, head_y = snake.snake_coords[-1]
+    height = len(game.level)
+    width = len(game.level[0])
+    options = []
+    for direction in range(4):
+        if direction == (snake.direction + 2) % 4:
+            continue
+        x, y = snake.neighbors[head_y][head_x][direction]
+        if game.level[y][x] == '#' or (x, y) in snake.occupied:
+            continue
+        distance = 0
+        if game.apple is not None:
+            dx = abs(x - game.apple[0])
+            dy = abs(y - game.apple[1])
+            distance = min(dx, width - dx) + min(dy, height - dy)
+        options.append((distance, rng.random(), direction))
+    if not options:
+        return None
+    return min(options)[2]
+
+
+autopilot = Autopilot()
+
+
+def autopilot_policy(game, rng):
+    # путь к яблоку в обход тела с проверкой, что после хода хватит места, см. autopilot.py
+    return autopilot.choose(game)
+
+
+POLICIES = {'random': random_policy, 'greedy': greedy_policy, 'autopilot': autopilot_policy}
+
+
+def level_files(levels_dir='data/levels'):
+    # файлы уровней по порядку сложности и номера
+    files = []
+    for name in os.listdir(levels_dir):
+        match = LEVEL_FILE_RE.match(name)
+        if match:
+            files.append((match.group(1), int(match.group(2)), name))
+    return [name for _, _, name in sorted(files)]
+
+
+def run_games(task):
+    # выполняется в дочернем процессе: играет игры с переданными seed, возвращает (счёт, ходы) каждой игры
+    name, level, snake_coords, policy_name, seeds, max_ticks = task
+    policy = POLICIES[policy_name]
+    results = []
+    start = time.perf_counter()
+    game = Engine()
+    for seed in seeds:
+        rng = random.Random(seed)
+        game.reset(level, seed, snake_coords)
+        status = 'continue'
+        while status == 'continue' and game.ticks < max_ticks:
+            _, _, status = game.step(policy(game, rng))
+        results.append((game.snake.score, game.ticks))
+    return name, results, time.perf_counter() - start
+
+
+def percentile(values, percent):
+    # перцентиль методом ближайшего ранга
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, round(percent / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def make_tasks(levels, games, policy_name, seed, max_ticks, chunk_size):
+    tasks = []
+    for level_index, (name, level, snake_coords) in enumerate(levels):
+        seeds = [seed + level_index * games + i for i in range(games)]
+        for i in range(0, games, chunk_size):
+            tasks.append((name, level, snake_coords, policy_name, seeds[i:i + chunk_size], max_ticks))
+    return tasks
+
+
+def format_row(title, results, work_time):
+    scores = [score for score, _ in results]
+    ticks = [game_ticks for _, game_ticks in results]
+    ticks_per_second = sum(ticks) / work_time if work_time else 0
+    return (f'{title:<16} {len(results):>6} {sum(scores) / len(scores):>8.2f} {percentile(scores, 50):>5} '
+            f'{percentile(scores, 90):>5} {percentile(scores, 99):>5} {sum(ticks) / len(ticks):>9.1f} '
+            f'{percentile(ticks, 50):>7} {percentile(ticks, 90):>7} {ticks_per_second:>10.0f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Оценка сложности уровней из data/levels')
+    parser.add_argument('--games', type=int, default=100, help='игр на каждый уровень')
+    parser.add_argument('--policy', choices=sorted(POLICIES), default='greedy')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='число процессов')
+    parser.add_argument('--seed', type=int, default=0, help='начальный seed, игры получают seed, seed + 1, ...')
+    parser.add_argument('--max-ticks', type=int, default=5000, help='ограничение длины одной игры')
+    parser.add_argument('--chunk-size', type=int, default=10, help='игр в одной задаче для процесса')
+    args = parser.parse_args()
+
+    # змейка появляется в клетке появления уровня, как в игре
+    levels = [(name, *load_level_and_spawn(name)) for name in level_files()]
+    tasks = make_tasks(levels, args.games, args.policy, args.seed, args.max_ticks, args.chunk_size)
+    results = {name: [] for name, _, _ in levels}
+    work_times = {name: 0.0 for name, _, _ in levels}
+    start = time.perf_counter()
+    with multiprocessing.Pool(args.workers) as pool:
+        for name, level_results, work_time in pool.imap_unordered(run_games, tasks):
+            results[name] += level_results
+            work_times[name] += work_time
+    wall_time = time.perf_counter() - start
+
+    print(f'{"уровень":<16} {"игр":>6} {"счёт":>8} {"p50":>5} {"p90":>5} {"p99":>5} {"ходов":>9} '
+          f'{"p50":>7} {"p90":>7} {"ходов/с":>10}')
+    by_difficulty = {}
+    for name, _, _ in levels:
+        print(format_row(name, results[name], work_times[name]))
+        difficulty = DIFFICULTIES.get(LEVEL_FILE_RE.match(name).group(1), '?')
+        total_results, total_time = by_difficulty.get(difficulty, ([], 0.0))
+        by_difficulty[difficulty] = (total_results + results[name], total_time + work_times[name])
+    print()
+    for difficulty, (total_results, total_time) in by_difficulty.items():
+        print(format_row(difficulty, total_results, total_time))
+    total_ticks = sum(game_ticks for level_results in results.values() for _, game_ticks in level_results)
+    print(f'\nвсего ходов: {total_ticks}, время: {wall_time:.2f} с, '
+          f'{total_ticks / wall_time:.0f} ходов/с на {args.workers} процессах')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+# Проверка уровней без запуска игры: связность поля с переходом через края, закрытые карманы,
+# безопасность появления змейки и клетки, в которых могут появляться яблоки.
+# Результат каждого уровня кэшируется рядом с ним в <уровень>.analysis.json по хэшу содержимого,
+# поэтому повторный запуск проверяет только изменённые уровни. Запуск из корня проекта
+# (например, перед коммитом): python level_analyzer.py
+# Код выхода 1, если на каком-то уровне змейка погибает на первом ходу или яблоку негде появиться
+import argparse
+import json
+import os
+import sys
+import time
+
+import level_pack
+from engine import RIGHT, build_neighbors, level_hash, load_level_and_spawn, reachable_cells
+
+CACHE_SUFFIX = '.analysis.json'
+
+
+def find_regions(level):
+    # области клеток без стен, связанные с учётом перехода через края, от большей к меньшей
+    regions = []
+    seen = set()
+    for y, row in enumerate(level):
+        for x, cell in enumerate(row):
+            if cell != '#' and (x, y) not in seen:
+                region = reachable_cells(level, (x, y))
+                seen |= region
+                regions.append(region)
+    return sorted(regions, key=len, reverse=True)
+
+
+def analyze_level(level, snake_coords):
+    # отчёт об уровне: размеры, области, карманы вне области змейки и ошибки
+    tail, head = tuple(snake_coords[0]), tuple(snake_coords[-1])
+    errors = []
+    for x, y in snake_coords:
+        if level[y][x] == '#':
+            errors.append(f'змейка появляется в стене в клетке ({x}, {y})')
+    if errors:
+        return {'width': len(level[0]), 'height': len(level), 'regions': [], 'area': 0, 'apple_cells': 0,
+                'pockets': [], 'errors': errors}
+    regions = find_regions(level)
+    area = next(region for region in regions if head in region)
+    x, y = build_neighbors(level)[head[1]][head[0]][RIGHT]
+    if level[y][x] == '#' or (x, y) in snake_coords:
+        # змейка сразу едет вправо, и игрок не успевает повернуть
+        errors.append(f'клетка ({x}, {y}) перед головой змейки занята, змейка погибает на первом ходу')
+    apple_cells = sum(level[y][x] == '.' for x, y in area) - (level[tail[1]][tail[0]] == '.') - \
+        (level[head[1]][head[0]] == '.')
+    if not apple_cells:
+        errors.append('в области змейки нет клеток для яблока')
+    # карманы: области, куда змейка не доползёт; клетка кармана с наименьшими (y, x) - чтобы найти его в файле
+    pockets = [{'size': len(region), 'cell': list(min(region, key=lambda cell: (cell[1], cell[0])))}
+               for region in regions if region is not area]
+    return {'width': len(level[0]), 'height': len(level), 'regions': [len(region) for region in regions],
+            'area': len(area), 'apple_cells': apple_cells, 'pockets': pockets, 'errors': errors}
+
+
+def cached_analysis(name, levels_dir=level_pack.LEVELS_DIR, force=False):
+    # отчёт об уровне name из кэша рядом с файлом уровня, если хэш уровня не изменился, иначе новый
+    level, snake_coords = load_level_and_spawn(name)
+    key = level_hash(level, snake_coords)
+    cache_file = os.path.join(levels_dir, name + CACHE_SUFFIX)
+    if not force and os.path.isfile(cache_file):
+        try:
+            with open(cache_file, encoding='UTF-8') as file:
+                cached = json.load(file)
+            if cached.get('hash') == key:
+                return cached['report'], True
+        except (OSError, ValueError, KeyError):
+            pass  # испорченный кэш считается заново
+    report = analyze_level(level, snake_coords)
+    with open(cache_file, 'w', encoding='UTF-8') as file:
+        json.dump({'hash': key, 'report': report}, file)
+    return report, False
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Проверка связности уровней и мест появления яблок')
+    parser.add_argument('names', nargs='*', help='файлы уровней в data/levels, по умолчанию все')
+    parser.add_argument('--force', action='store_true', help='не использовать кэш')
+    args = parser.parse_args()
+    names = args.names or sorted(name for name in os.listdir(level_pack.LEVELS_DIR) if name.endswith('.txt'))
+    start = time.perf_counter()
+    failed = 0
+    from_cache = 0
+    for name in names:
+        report, cached = cached_analysis(name, force=args.force)
+        from_cache += cached
+        pockets = report['pockets']
+        line = (f'{name}: {report["width"]}x{report["height"]}, областей {len(report["regions"])}, '
+                f'у змейки {report["area"]} клеток, яблок может появиться в {report["apple_cells"]}')
+        if pockets:
+            line += f', карманов {len(pockets)} ({sum(pocket["size"] for pocket in pockets)} клеток)'
+        print(line)
+        for pocket in pockets:
+            print(f'  карман из {pocket["size"]} клеток у ({pocket["cell"][0]}, {pocket["cell"][1]}), '
+                  f'яблоки там не появляются')
+        for error in report['errors']:
+            print(f'  ОШИБКА: {error}')
+        failed += bool(report['errors'])
+    print(f'уровней: {len(names)}, из кэша: {from_cache}, с ошибками: {failed}, '
+          f'{time.perf_counter() - start:.3f} с')
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
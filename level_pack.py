@@ -0,0 +1,171 @@
+# Пак уровней: все data/levels/*.txt, собранные в один двоичный файл data/levels.pack.
+# Игра читает уровни из пака через mmap без разбора текста, а если пак не собран
+# или уровни менялись после сборки - из текстовых файлов.
+# Сборка после изменения уровней, из корня проекта: python level_pack.py
+#
+# Формат (little-endian): заголовок HEADER (MAGIC, версия, число уровней), затем записи ENTRY
+# (имя файла, ширина, высота, клетка хвоста змейки при появлении, смещение сетки) и сами сетки:
+# height строк по width байт, байт клетки - её символ '.', '#' или '@'.
+# В текстовом уровне клетку появления хвоста можно отметить символом 'S', голова встаёт справа от неё
+import argparse
+import mmap
+import os
+import struct
+import sys
+
+MAGIC = b'SNKP'
+VERSION = 1
+HEADER = struct.Struct('<4sHI')
+NAME_SIZE = 64  # байт на имя файла уровня в записи
+ENTRY = struct.Struct(f'<{NAME_SIZE}sHHHHQ')
+LEVELS_DIR = os.path.join('data', 'levels')
+PACK_FILE = os.path.join('data', 'levels.pack')
+CELLS = frozenset('.#@')
+SPAWN_CELL = 'S'
+DEFAULT_SPAWN = (0, 0)
+MAX_SIDE = 65535
+
+
+def read_level_file(filename):
+    # строки уровня, дополненные '.' до одной ширины, и клетка появления хвоста
+    with open(filename, 'r') as mapFile:
+        rows = [line.strip() for line in mapFile]
+    max_width = max(map(len, rows))
+    rows = [row.ljust(max_width, '.') for row in rows]
+    spawn = DEFAULT_SPAWN
+    for y, row in enumerate(rows):
+        x = row.find(SPAWN_CELL)
+        if x != -1:
+            spawn = (x, y)
+            rows[y] = row.replace(SPAWN_CELL, '.')
+    return rows, spawn
+
+
+def check_level(name, rows, spawn):
+    # ошибки уровня, из-за которых его нельзя положить в пак
+    if len(name.encode()) > NAME_SIZE:
+        raise ValueError(f'{name}: слишком длинное имя файла')
+    if not rows or not rows[0]:
+        raise ValueError(f'{name}: пустой уровень')
+    if len(rows) > MAX_SIDE or len(rows[0]) > MAX_SIDE:
+        raise ValueError(f'{name}: уровень больше {MAX_SIDE} клеток по стороне')
+    for y, row in enumerate(rows):
+        wrong = set(row) - CELLS
+        if wrong:
+            raise ValueError(f'{name}: неизвестные символы {"".join(sorted(wrong))} в строке {y + 1}')
+    x, y = spawn
+    if rows[y][x] == '#' or rows[y][(x + 1) % len(rows[0])] == '#':
+        raise ValueError(f'{name}: змейка появляется в стене')
+
+
+def build_pack(levels_dir=LEVELS_DIR, filename=PACK_FILE):
+    # собирает пак из всех .txt в levels_dir, возвращает число уровней
+    levels = []
+    for name in sorted(os.listdir(levels_dir)):
+        if name.endswith('.txt'):
+            rows, spawn = read_level_file(os.path.join(levels_dir, name))
+            check_level(name, rows, spawn)
+            levels.append((name, rows, spawn))
+    offset = HEADER.size + ENTRY.size * len(levels)
+    index = [HEADER.pack(MAGIC, VERSION, len(levels))]
+    grids = []
+    for name, rows, spawn in levels:
+        index.append(ENTRY.pack(name.encode(), len(rows[0]), len(rows), spawn[0], spawn[1], offset))
+        grid = ''.join(rows).encode('ascii')
+        grids.append(grid)
+        offset += len(grid)
+    # пак пишется во временный файл и подменяется целиком, чтобы игра не прочитала его наполовину
+    with open(filename + '.tmp', 'wb') as file:
+        file.write(b''.join(index + grids))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(filename + '.tmp', filename)
+    return len(levels)
+
+
+class LevelPack:
+    def __init__(self, filename=PACK_FILE):
+        with open(filename, 'rb') as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.data) < HEADER.size:
+            raise ValueError(f'{filename}: файл слишком короткий для пака уровней')
+        magic, version, count = HEADER.unpack_from(self.data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{filename}: не пак уровней версии {VERSION}')
+        if HEADER.size + ENTRY.size * count > len(self.data):
+            raise ValueError(f'{filename}: пак обрезан')
+        self.entries = {}  # имя файла уровня -> (ширина, высота, клетка появления, смещение сетки)
+        for i in range(count):
+            name, width, height, spawn_x, spawn_y, offset = ENTRY.unpack_from(
+                self.data, HEADER.size + ENTRY.size * i)
+            if not width or not height or offset + width * height > len(self.data) or \
+                    spawn_x >= width or spawn_y >= height:
+                raise ValueError(f'{filename}: повреждена запись уровня {i}')
+            self.entries[name.rstrip(b'\0').decode()] = (width, height, (spawn_x, spawn_y), offset)
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def names(self):
+        return sorted(self.entries)
+
+    def size(self, name):
+        width, height, _, _ = self.entries[name]
+        return width, height
+
+    def spawn(self, name):
+        return self.entries[name][2]
+
+    def grid(self, name):
+        # сетка уровня без копирования: memoryview байт формы (высота, ширина) прямо из пака
+        width, height, _, offset = self.entries[name]
+        return memoryview(self.data)[offset:offset + width * height].cast('B', (height, width))
+
+    def level(self, name):
+        # изменяемая копия сетки в виде списка строк из символов, как у load_level
+        width, height, _, offset = self.entries[name]
+        text = self.data[offset:offset + width * height].decode('ascii')
+        return [list(text[y * width:(y + 1) * width]) for y in range(height)]
+
+
+opened_packs = {}  # имя файла пака -> LevelPack или None, если пак не используется
+
+
+def pack_is_fresh(filename=PACK_FILE, levels_dir=LEVELS_DIR):
+    # пак собран и ни один текстовый уровень не менялся после сборки
+    if not os.path.isfile(filename):
+        return False
+    pack_time = os.path.getmtime(filename)
+    for entry in os.scandir(levels_dir):
+        if entry.name.endswith('.txt') and entry.stat().st_mtime > pack_time:
+            print(f"Пак уровней '{filename}' старше '{entry.path}', уровни читаются из текстовых файлов. "
+                  f"Пересоберите пак: python level_pack.py")
+            return False
+    return True
+
+
+def open_pack(filename=PACK_FILE, levels_dir=LEVELS_DIR):
+    # пак открывается один раз за запуск
+    if filename not in opened_packs:
+        opened_packs[filename] = LevelPack(filename) if pack_is_fresh(filename, levels_dir) else None
+    return opened_packs[filename]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Сборка пака уровней из текстовых файлов')
+    parser.add_argument('--levels-dir', default=LEVELS_DIR, help='папка с уровнями .txt')
+    parser.add_argument('--output', default=PACK_FILE, help='файл пака')
+    args = parser.parse_args()
+    try:
+        count = build_pack(args.levels_dir, args.output)
+    except ValueError as error:
+        print(error)
+        sys.exit(1)
+    print(f'{args.output}: {count} уровней, {os.path.getsize(args.output)} байт')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,30 +1,51 @@
-import os
-import random
-import sys
+import time
 
-import pygame
+start_time = time.perf_counter()  # от него считается время до первого кадра, до загрузки остальных модулей
 
+# numpy, частицы, автопилот, запись игр и пул потоков меню не нужны,
+# они импортируются там, где используются, уже после показа главного меню
+import functools  # noqa: E402
+import os  # noqa: E402
+import sys  # noqa: E402
+from collections import OrderedDict, deque  # noqa: E402
+
+import pygame  # noqa: E402
+
+from engine import DIRECTION_NAMES, DOWN, LEFT, RIGHT, UP, Engine, load_level, load_level_and_spawn  # noqa: E402
+
+first_frame_time = None  # секунд от начала загрузки модуля до показа главного меню
 WIDTH, HEIGHT = 750, 800  # размеры окна
 TILE_SIZE = 25  # размер игровой плитки
 MINI_TILE_SIZE = 15  # размер плитки схемы уровня
-START_SCREENS_FPS = 10  # fps на начальных экранах
+VIEW_CELLS = (WIDTH // TILE_SIZE, (HEIGHT - 50) // TILE_SIZE)  # сколько клеток уровня видно на экране
+CAMERA_MARGIN = 5  # ближе к краю окна голова не подходит, окно сдвигается
+THUMBNAIL_SIZE = 450  # наибольшая сторона схемы уровня на экране выбора
+CHUNK_SIZE = 16  # клеток по стороне куска фона уровня
+CHUNK_CACHE_SIZE = 32  # сколько кусков фона хранится, давно не показанные удаляются
+START_SCREENS_FPS = 10  # fps анимации на экране настроек
+IDLE_TIMEOUT = 1000  # мс, не дольше которых экраны без анимации ждут событий
+RENDER_FPS = 60  # частота кадров в игре, скорость змейки задаётся отдельно сложностью
+MAX_STEPS_PER_FRAME = 5  # больше ходов за кадр не делается, если игра не успевает
+INPUT_QUEUE_SIZE = 3  # сколько поворотов можно нажать заранее
+WINDOW_REDRAW_EVENTS = {pygame.WINDOWEXPOSED, pygame.WINDOWRESTORED, pygame.WINDOWSIZECHANGED}
+HUD_RECT = pygame.Rect(0, 740, WIDTH, HEIGHT - 740)  # область подсказок, очков и рекорда
+DIRECTION_KEYS = {pygame.K_UP: UP, pygame.K_RIGHT: RIGHT, pygame.K_DOWN: DOWN, pygame.K_LEFT: LEFT}
+DIRECTION_VECTORS = {UP: (0, -1), RIGHT: (1, 0), DOWN: (0, 1), LEFT: (-1, 0)}
 
 music_menu_flag = True
 
 all_sprites = pygame.sprite.Group()
-mini_tiles_group = pygame.sprite.Group()
 tiles_group = pygame.sprite.Group()
 snake_group = pygame.sprite.Group()
-horizontal_borders_group = pygame.sprite.Group()
-vertical_borders_group = pygame.sprite.Group()
 
 # Следующие группы не относятся к all_sprites
-particle_group = pygame.sprite.Group()
 game_over_group = pygame.sprite.Group()
 animated_group = pygame.sprite.Group()
 
 
 def terminate():
+    if records is not None:
+        records.save()
     pygame.quit()
     sys.exit()
 
@@ -53,23 +74,58 @@ def menu_music(name, vol, flag):
         start_music(name, vol)
 
 
+class SoundBank:
+    # звуковые эффекты декодируются один раз (в фоне через assets) и проигрываются на пуле
+    # зарезервированных каналов микшера, одновременно звучит не больше max_copies копий эффекта
+    def __init__(self, channels_count=4, max_copies=2):
+        if pygame.mixer.get_num_channels() < channels_count:
+            pygame.mixer.set_num_channels(channels_count)
+        pygame.mixer.set_reserved(channels_count)
+        self.channels = [pygame.mixer.Channel(i) for i in range(channels_count)]
+        self.max_copies = max_copies
+
+    def play(self, name):
+        sound = assets.sound(name)
+        free_channel = None
+        copies = 0
+        for channel in self.channels:
+            if not channel.get_busy():
+                if free_channel is None:
+                    free_channel = channel
+            elif channel.get_sound() is sound:
+                copies += 1
+        if free_channel is not None and copies < self.max_copies:
+            free_channel.play(sound)
+
+
+sound_effects = ['click.mp3', 'eat_food.mp3', 'game_over.mp3']
+sound_bank = None  # создаётся в App, когда микшер уже инициализирован
+
+
 def click_sound():
-    load_sound('click.mp3').play()
+    sound_bank.play('click.mp3')
+
+
+def wait_events(timeout=IDLE_TIMEOUT):
+    # События для экранов, которые меняются только от ввода: меню, рекорды, пауза.
+    # Поток спит в ожидании первого события не дольше timeout мс вместо опроса каждый кадр.
+    # Кадр показывается заново, только если окно было перекрыто и открылось снова
+    events = [pygame.event.wait(timeout)] + pygame.event.get()
+    if any(event.type in WINDOW_REDRAW_EVENTS for event in events):
+        pygame.display.flip()
+    return [event for event in events if event.type != pygame.NOEVENT]
+
+
+particles = None  # ParticleSystem, создаётся в show_first_frame; границы задаются полем уровня в LevelRenderer
 
 
 def spawn_particles_on_eat(x, y):
-    color = (240, 0, 0)
-    for _ in range(10):  # 10 частиц за раз
-        particle = Particle(x, y, color)
-        particle_group.add(particle)
+    particles.spawn(x + TILE_SIZE // 2, y + TILE_SIZE // 2, (240, 0, 0), 10)  # 10 частиц за раз
 
 
 # Функция для создания частиц при ударе об стену
 def spawn_particles_on_wall_collision(x, y):
-    color = (0, 0, 0)
-    for _ in range(20):  # Больше частиц при ударе о стену
-        particle = Particle(x, y, color)
-        particle_group.add(particle)
+    particles.spawn(x + TILE_SIZE // 2, y + TILE_SIZE // 2, (0, 0, 0), 20)  # Больше частиц при ударе о стену
 
 
 def load_image(name, colorkey=None):
@@ -81,25 +137,172 @@ def load_image(name, colorkey=None):
     return image
 
 
-def load_level(filename):
-    filename = "data/levels/" + filename
-    with open(filename, 'r') as mapFile:
-        level_map = [line.strip() for line in mapFile]
-    max_width = max(map(len, level_map))
-    return list(map(lambda x: list(x.ljust(max_width, '.')), level_map))
+class Assets:
+    # Кэш изображений и звуков. Загрузка и масштабирование могут идти в фоновом потоке (preload),
+    # в главном потоке готовое изображение только приводится к формату экрана.
+    # Ключ ресурса: ('image', имя), ('screen', имя) - картинка во весь экран, или ('sound', имя)
+    def __init__(self):
+        self.loaded = {}  # ключ -> готовый ресурс
+        self.pending = {}  # ключ -> Future загрузки в фоне
+        self.executor = None
+
+    def load(self, key):
+        kind, name = key
+        if kind == 'sound':
+            return load_sound(name)
+        image = load_image(name)
+        if kind == 'screen':
+            image = pygame.transform.scale(image, (WIDTH, HEIGHT))
+        return image
+
+    def get(self, key):
+        if key not in self.loaded:
+            if key in self.pending:
+                resource = self.pending.pop(key).result()
+            else:
+                resource = self.load(key)
+            if key[0] == 'screen' and pygame.display.get_surface() is not None:
+                resource = resource.convert()
+            self.loaded[key] = resource
+        return self.loaded[key]
+
+    def image(self, name):
+        return self.get(('image', name))
+
+    def screen_image(self, name):
+        return self.get(('screen', name))
+
+    def sound(self, name):
+        return self.get(('sound', name))
+
+    def preload(self, keys):
+        # ресурсы грузятся по порядку в одном фоновом потоке
+        for key in keys:
+            if key not in self.loaded and key not in self.pending:
+                if self.executor is None:
+                    from concurrent.futures import ThreadPoolExecutor
+                    self.executor = ThreadPoolExecutor(max_workers=1)
+                self.pending[key] = self.executor.submit(self.load, key)
+
+
+assets = Assets()
+
+
+@functools.lru_cache(maxsize=None)
+def get_font(size):
+    # шрифт каждого размера загружается один раз
+    return pygame.font.Font('data/segoeprint.ttf', size)
+
+
+@functools.lru_cache(maxsize=128)
+def render_text(text, size, color):
+    # отрисованные строки кэшируются, повторно рендерится только изменившийся текст
+    return get_font(size).render(text, 1, color)
 
 
 sprites_sheets = ['sprites_sheet_1.png', 'sprites_sheet_2.png']
 empty_images = ['tile1.jpg', 'tile2.jpg', 'tile3.jpg']
 wall_images = ['wall1.jpg', 'wall2.jpg']
 apple_images = ['apple1.png', 'apple2.png']
-snake_images = {}
-other_images = {'empty': load_image('tile1.jpg'),
-                'wall': load_image('wall1.jpg'),
-                'apple': load_image('apple1.png')}
+snake_images = {}  # изображения текущей темы, заполняются в Themes.select
+other_images = {}
+
+
+# кэш отмасштабированных изображений текущей темы: (название, размер плитки) -> поверхность
+scaled_images = {}
+
+
+def get_scaled_image(name, size):
+    # изображение из snake_images или other_images, отмасштабированное под размер плитки один раз на тему
+    key = (name, size)
+    if key not in scaled_images:
+        image = snake_images[name] if name in snake_images else other_images[name]
+        image = pygame.transform.scale(image, (
+            int(image.get_width() / 50 * size), int(image.get_height() / 50 * size)))
+        if pygame.display.get_surface() is not None:
+            # приводим к формату пикселей экрана, чтобы blit не конвертировал каждый раз
+            if image.get_flags() & pygame.SRCALPHA:
+                image = image.convert_alpha()
+            else:
+                image = image.convert()
+        scaled_images[key] = image
+    return scaled_images[key]
+
+
+def invalidate_scaled_images():
+    # вызывается при смене темы
+    scaled_images.clear()
+    level_thumbnails.clear()
+
+
+def render_thumbnail(level, tiles):
+    # схема уровня для экрана выбора: пол и стены плитками MINI_TILE_SIZE, остальное прозрачное
+    if max(len(level[0]), len(level)) * MINI_TILE_SIZE > THUMBNAIL_SIZE:
+        return render_large_thumbnail(level, tiles)
+    surface = pygame.Surface((len(level[0]) * MINI_TILE_SIZE, len(level) * MINI_TILE_SIZE), pygame.SRCALPHA)
+    for y in range(len(level)):
+        for x in range(len(level[0])):
+            if level[y][x] in tiles:
+                surface.blit(tiles[level[y][x]], (MINI_TILE_SIZE * x, MINI_TILE_SIZE * y))
+    return surface
+
+
+def render_large_thumbnail(level, tiles):
+    # большой уровень: клетка - пиксель среднего цвета своей плитки, картинка уменьшается до THUMBNAIL_SIZE
+    import numpy as np
+    grid = np.array(level)
+    pixels = np.zeros((len(level[0]), len(level), 3), np.uint8)
+    pixels[:] = pygame.transform.average_color(tiles['.'])[:3]
+    for cell, tile in tiles.items():
+        pixels[(grid == cell).T] = pygame.transform.average_color(tile)[:3]
+    scale = THUMBNAIL_SIZE / max(len(level[0]), len(level))
+    return pygame.transform.smoothscale(pygame.surfarray.make_surface(pixels),
+                                        (max(1, round(len(level[0]) * scale)), max(1, round(len(level) * scale))))
+
+
+class LevelThumbnails:
+    # одна готовая схема на файл уровня, схемы соседних уровней рисуются заранее в фоновом потоке
+    def __init__(self):
+        self.surfaces = {}  # имя файла уровня -> поверхность схемы
+        self.pending = {}  # имя файла уровня -> Future схемы, которая ещё рисуется
+        self.executor = None
+
+    def tiles(self):
+        # изображения берутся в главном потоке, потому что кэш get_scaled_image не защищён от потоков
+        return {'.': get_scaled_image('empty', MINI_TILE_SIZE), '#': get_scaled_image('wall', MINI_TILE_SIZE)}
+
+    def get(self, name):
+        if name in self.pending:
+            self.surfaces[name] = self.pending.pop(name).result()
+        if name not in self.surfaces:
+            self.surfaces[name] = render_thumbnail(load_level(name), self.tiles())
+        return self.surfaces[name]
+
+    def prefetch(self, names):
+        tiles = None
+        for name in names:
+            if name not in self.surfaces and name not in self.pending:
+                if self.executor is None:
+                    from concurrent.futures import ThreadPoolExecutor
+                    self.executor = ThreadPoolExecutor(max_workers=1)
+                if tiles is None:
+                    tiles = self.tiles()
+                self.pending[name] = self.executor.submit(lambda name=name: render_thumbnail(load_level(name), tiles))
+
+    def clear(self):
+        # схемы нарисованы плитками старой темы
+        for future in self.pending.values():
+            future.cancel()
+        self.pending.clear()
+        self.surfaces.clear()
+
+
+level_thumbnails = LevelThumbnails()
 
 
 def cut_sheet(sheet, columns, rows):
+    # кадры змейки из листа спрайтов: название куска -> подповерхность листа
+    snake_images = {}
     rect = pygame.Rect(0, 0, sheet.get_width() // columns,
                        sheet.get_height() // rows)
     frame_location = (0, 0)
@@ -130,9 +333,45 @@ def cut_sheet(sheet, columns, rows):
     snake_images['end_right'] = sheet.subsurface(pygame.Rect(frame_location, rect.size))
     frame_location = (200, 150)
     snake_images['end_up'] = sheet.subsurface(pygame.Rect(frame_location, rect.size))
-
-
-cut_sheet(load_image('sprites_sheet_1.png'), 5, 4)
+    return snake_images
+
+
+class Themes:
+    # Варианты оформления загружаются через assets и нарезаются один раз,
+    # смена темы только подставляет готовые изображения в snake_images и other_images
+    def __init__(self):
+        self.sheets = {}  # номер листа спрайтов -> нарезанные кадры
+        self.images = {'empty': empty_images, 'apple': apple_images, 'wall': wall_images}
+        self.selection = None  # (лист спрайтов, пол, яблоко, стена), задаётся после первого кадра
+
+    def sheet(self, index):
+        if index not in self.sheets:
+            self.sheets[index] = cut_sheet(assets.image(sprites_sheets[index]), 5, 4)
+        return self.sheets[index]
+
+    def asset_keys(self):
+        # все изображения тем для фоновой загрузки, сначала тема по умолчанию
+        names = [sprites_sheets[0], empty_images[0], apple_images[0], wall_images[0]]
+        names += sprites_sheets + empty_images + apple_images + wall_images
+        return [('image', name) for name in names]
+
+    def select(self, sprite_sheet, empty_image, apple_image, wall_image):
+        # возвращает True, если тема сменилась
+        selection = (sprite_sheet, empty_image, apple_image, wall_image)
+        if selection == self.selection:
+            return False
+        self.selection = selection
+        snake_images.clear()
+        snake_images.update(self.sheet(sprite_sheet))
+        other_images['empty'] = assets.image(self.images['empty'][empty_image])
+        other_images['apple'] = assets.image(self.images['apple'][apple_image])
+        other_images['wall'] = assets.image(self.images['wall'][wall_image])
+        invalidate_scaled_images()
+        return True
+
+
+themes = Themes()
+screen_images = ['menu_1.jpg', 'menu_2.jpg', 'menu_3.jpg', 'settings_screen.jpg']
 
 
 def reset_sprites():
@@ -140,70 +379,18 @@ def reset_sprites():
         spr.kill()
     for spr in game_over_group:
         spr.kill()
-    for spr in particle_group:
-        spr.kill()
-
-
-class Border(pygame.sprite.Sprite):  # класс Border используется, чтобы частицы не выходили за экран (критерий collide)
-    # строго вертикальный или строго горизонтальный отрезок
-    def __init__(self, x1, y1, x2, y2):
-        super().__init__(all_sprites)
-        if x1 == x2:  # вертикальная стенка
-            self.add(vertical_borders_group)
-            self.image = pygame.Surface([1, y2 - y1])
-            self.rect = pygame.Rect(x1, y1, 1, y2 - y1)
-        else:  # горизонтальная стенка
-            self.add(horizontal_borders_group)
-            self.image = pygame.Surface([x2 - x1, 1])
-            self.rect = pygame.Rect(x1, y1, x2 - x1, 1)
-
-
-class Particle(pygame.sprite.Sprite):
-    def __init__(self, x, y, color):
-        super().__init__(particle_group)
-        part_side = random.randint(3, 9)
-        self.image = pygame.Surface((part_side, part_side))
-        self.image.fill(color)
-        self.rect = self.image.get_rect(center=(x + 12, y + 12))
-        self.lifetime = random.randint(5, 15)
-        self.vel_x = random.uniform(-1, 2)
-        self.vel_y = random.uniform(-1, 2)
-
-    def update(self):
-        self.rect.x += self.vel_x
-        self.rect.y += self.vel_y
-        self.lifetime -= 1
-
-        if self.lifetime <= 0:
-            self.kill()  # Удаляем спрайт, когда его время жизни заканчивается
-        elif (pygame.sprite.spritecollideany(self, vertical_borders_group) or
-              pygame.sprite.spritecollideany(self, horizontal_borders_group)):
-            self.kill()  # Удаляем спрайт, если он заходит за пределы игрового поля
-
-
-class MiniTile(pygame.sprite.Sprite):
-    def __init__(self, tile_type, pos_x, pos_y):
-        super().__init__(mini_tiles_group, all_sprites)
-        tile_image = other_images[tile_type]
-        scaled_image = pygame.transform.scale(tile_image, (
-            int(tile_image.get_width() / 50 * MINI_TILE_SIZE), int(tile_image.get_height() / 50 * MINI_TILE_SIZE)))
-        self.image = scaled_image
-        self.rect = self.image.get_rect().move(
-            150 + MINI_TILE_SIZE * pos_x, 125 + MINI_TILE_SIZE * pos_y)
+    particles.clear()
 
 
 class Tile(pygame.sprite.Sprite):
     def __init__(self, tile_type, x, y, scaled=True):
         super().__init__(tiles_group, all_sprites)
-        tile_image = other_images[tile_type]
         if scaled:
-            scaled_image = pygame.transform.scale(tile_image, (
-                int(tile_image.get_width() / 50 * TILE_SIZE), int(tile_image.get_height() / 50 * TILE_SIZE)))
-            self.image = scaled_image
+            self.image = get_scaled_image(tile_type, TILE_SIZE)
             self.rect = self.image.get_rect().move(
                 TILE_SIZE * x, TILE_SIZE * y)
         else:
-            self.image = tile_image
+            self.image = get_scaled_image(tile_type, 50)
             self.rect = self.image.get_rect().move(
                 50 * x, 50 * y)
 
@@ -212,15 +399,12 @@ class SnakePart(pygame.sprite.Sprite):
     def __init__(self, type, x, y, scaled=True):
         super().__init__(snake_group, all_sprites)
         self.frames = []
-        snake_image = snake_images[type]
         if scaled:
-            scaled_image = pygame.transform.scale(snake_image, (
-                int(snake_image.get_width() / 50 * TILE_SIZE), int(snake_image.get_height() / 50 * TILE_SIZE)))
-            self.image = scaled_image
+            self.image = get_scaled_image(type, TILE_SIZE)
             self.rect = self.image.get_rect().move(
                 TILE_SIZE * x, TILE_SIZE * y)
         else:
-            self.image = snake_image
+            self.image = get_scaled_image(type, 50)
             self.rect = self.image.get_rect().move(x * 50, y * 50)
 
 
@@ -237,92 +421,17 @@ class AnimatedSnakeShowcase(pygame.sprite.Sprite):  # критерий аним
         self.image = self.frames[self.cur_frame]
 
 
-class Snake:
-    def __init__(self, snake_coords):
-        self.snake_coords = snake_coords
-        self.direction = 'right'
-        self.score = 0
-        self.forbidden_moves = {'up': 'down',
-                                'down': 'up',
-                                'left': 'right',
-                                'right': 'left'}
-
-    def change_direction(self, direction):
-        if self.forbidden_moves[direction] != self.direction:
-            self.direction = direction
-
-    def move(self, level):
-        last_x, last_y = self.snake_coords[-1][0], self.snake_coords[-1][1]
-        max_x_y = len(level) - 1
-        if self.direction == 'right':
-            if last_x + 1 > max_x_y:
-                if level[last_y][0] == '#' or (0, last_y) in self.snake_coords:
-                    return 'game_over'
-                else:
-                    self.snake_coords.append((0, last_y))
-            elif level[last_y][last_x + 1] == '#' or (
-                    last_x + 1, last_y) in self.snake_coords:
-                return 'game_over'
-            else:
-                self.snake_coords.append((last_x + 1, last_y))
-        elif self.direction == 'left':
-            if last_x - 1 < 0:
-                if level[last_y][max_x_y] == '#' or (max_x_y, last_y) in self.snake_coords:
-                    return 'game_over'
-                else:
-                    self.snake_coords.append((max_x_y, last_y))
-            elif level[last_y][last_x - 1] == '#' or (last_x - 1, last_y) in self.snake_coords:
-                return 'game_over'
-            else:
-                self.snake_coords.append((last_x - 1, last_y))
-        elif self.direction == 'up':
-            if last_y - 1 < 0:
-                if level[max_x_y][last_x] == '#' or (last_x, max_x_y) in self.snake_coords:
-                    return 'game_over'
-                else:
-                    self.snake_coords.append((last_x, max_x_y))
-            elif level[last_y - 1][last_x] == '#' or (last_x, last_y - 1) in self.snake_coords:
-                return 'game_over'
-            else:
-                self.snake_coords.append((last_x, last_y - 1))
-        elif self.direction == 'down':
-            if last_y + 1 > len(level) - 1:
-                if level[0][last_x] == '#' or (last_x, 0) in self.snake_coords:
-                    return 'game_over'
-                else:
-                    self.snake_coords.append((last_x, 0))
-            elif level[last_y + 1][last_x] == '#' or (last_x, last_y + 1) in self.snake_coords:
-                return 'game_over'
-            else:
-                self.snake_coords.append((last_x, last_y + 1))
-        new_last_x, new_last_y = self.snake_coords[-1][0], self.snake_coords[-1][1]
-        if level[new_last_y][new_last_x] != '@':
-            self.snake_coords.pop(0)
-        else:
-            self.score += 1
-            level[new_last_y][new_last_x] = '.'
-            win = create_apple(level, self)
-            spawn_particles_on_eat(new_last_x * TILE_SIZE, new_last_y * TILE_SIZE)
-            load_sound('eat_food.mp3').play()
-            if win:
-                return 'win'
-        return 'continue'
-
-
 class Apple(pygame.sprite.Sprite):
     def __init__(self, x, y, scaled=True):
         super().__init__(all_sprites)
         self.pos_x = x
         self.pos_y = y
-        image = other_images['apple']
         if scaled:
-            scaled_image = pygame.transform.scale(image, (
-                int(image.get_width() / 50 * TILE_SIZE), int(image.get_height() / 50 * TILE_SIZE)))
-            self.image = scaled_image
+            self.image = get_scaled_image('apple', TILE_SIZE)
             self.rect = self.image.get_rect().move(
                 TILE_SIZE * x, TILE_SIZE * y)
         else:
-            self.image = image
+            self.image = get_scaled_image('apple', 50)
             self.rect = self.image.get_rect().move(x * 50, y * 50)
 
 
@@ -330,9 +439,9 @@ class GameOver(pygame.sprite.Sprite):
     def __init__(self, type='game_over'):
         super().__init__(game_over_group)
         if type == 'win':
-            self.image = load_image('win_screen.jpg')
+            self.image = assets.image('win_screen.jpg')
         else:
-            self.image = load_image("game_over_screen.jpg")
+            self.image = assets.image('game_over_screen.jpg')
         self.rect = self.image.get_rect()
         self.rect.x = - WIDTH
         self.rect.y = 0
@@ -344,20 +453,12 @@ class GameOver(pygame.sprite.Sprite):
             self.rect.x += 50
 
 
-def generate_scheme(level):
-    for y in range(len(level)):
-        for x in range(len(level[0])):
-            if level[y][x] == '.':
-                MiniTile('empty', x, y)
-            elif level[y][x] == '#':
-                MiniTile('wall', x, y)
-
-
-def start_screen_1(screen, clock):
-    fon = pygame.transform.scale(load_image('menu_1.jpg'), (WIDTH, HEIGHT))
+def start_screen_1(screen):
+    fon = assets.screen_image('menu_1.jpg')
     screen.blit(fon, (0, 0))
+    pygame.display.flip()
     while True:
-        for event in pygame.event.get():
+        for event in wait_events():
             if event.type == pygame.QUIT:
                 terminate()
             elif event.type == pygame.MOUSEBUTTONDOWN:
@@ -373,15 +474,13 @@ def start_screen_1(screen, clock):
                         click_sound()
                         return 'settings'
 
-        pygame.display.flip()
-        clock.tick(START_SCREENS_FPS)
 
-
-def start_screen_2(screen, clock):
-    fon = pygame.transform.scale(load_image('menu_2.jpg'), (WIDTH, HEIGHT))
+def start_screen_2(screen):
+    fon = assets.screen_image('menu_2.jpg')
     screen.blit(fon, (0, 0))
+    pygame.display.flip()
     while True:
-        for event in pygame.event.get():
+        for event in wait_events():
             if event.type == pygame.QUIT:
                 terminate()
             elif event.type == pygame.MOUSEBUTTONDOWN:
@@ -400,12 +499,10 @@ def start_screen_2(screen, clock):
                 if event.key == pygame.K_ESCAPE:
                     reset_sprites()
                     return 'escape'  # выход на главный экран
-        pygame.display.flip()
-        clock.tick(START_SCREENS_FPS)
 
 
-def start_screen_3(screen, clock, difficulty):
-    fon = pygame.transform.scale(load_image('menu_3.jpg'), (WIDTH, HEIGHT))
+def start_screen_3(screen, difficulty):
+    fon = assets.screen_image('menu_3.jpg')
     screen.blit(fon, (0, 0))
     curlevel = 0
     first_num = '1'
@@ -415,9 +512,7 @@ def start_screen_3(screen, clock, difficulty):
         first_num = '2'
     elif difficulty == 'hard':
         first_num = '3'
-    level = load_level(f'level{first_num}_{curlevel}.txt')
-    font = pygame.font.Font('data/segoeprint.ttf', 70)
-    string_rendered = font.render(str(curlevel + 1), 1, (255, 106, 0))
+    string_rendered = render_text(str(curlevel + 1), 70, (255, 106, 0))
     intro_rect = string_rendered.get_rect()
     text_coord_x = 425
     text_coord_y = 575
@@ -428,15 +523,28 @@ def start_screen_3(screen, clock, difficulty):
     def draw_number(number, intro_rect):
         screen.blit(fon, (text_coord_x, text_coord_y),
                     (text_coord_x, text_coord_y, intro_rect.width, intro_rect.height))
-        string_rendered = font.render(str(number), 1, (255, 106, 0))
+        string_rendered = render_text(str(number), 70, (255, 106, 0))
         intro_rect = string_rendered.get_rect()
         intro_rect.top = text_coord_y
         intro_rect.x = text_coord_x
         screen.blit(string_rendered, intro_rect)
         return intro_rect
 
+    def level_name(number):
+        return f'level{first_num}_{number % 10}.txt'
+
+    def draw_scheme(scheme_rect):
+        # схема рисуется только при смене уровня, старая закрывается фоном
+        if scheme_rect is not None:
+            screen.blit(fon, scheme_rect, scheme_rect)
+        thumbnail = level_thumbnails.get(level_name(curlevel))
+        level_thumbnails.prefetch([level_name(curlevel + 1), level_name(curlevel - 1)])
+        return screen.blit(thumbnail, (150, 125))
+
+    scheme_rect = draw_scheme(None)
+    pygame.display.flip()
     while True:
-        for event in pygame.event.get():
+        for event in wait_events():
             if event.type == pygame.QUIT:
                 terminate()
             elif event.type == pygame.MOUSEBUTTONDOWN:
@@ -446,125 +554,283 @@ def start_screen_3(screen, clock, difficulty):
                         curlevel -= 1
                     else:
                         curlevel = 9
-                    level = load_level(f'level{first_num}_{curlevel}.txt')
                     intro_rect = draw_number(curlevel + 1, intro_rect)
+                    scheme_rect = draw_scheme(scheme_rect)
+                    pygame.display.flip()
                     click_sound()
                 elif 700 <= x <= 750 and 270 + abs(x - 700) <= y <= 430 - abs(x - 700):
                     if curlevel != 9:
                         curlevel += 1
                     else:
                         curlevel = 0
-                    level = load_level(f'level{first_num}_{curlevel}.txt')
                     intro_rect = draw_number(curlevel + 1, intro_rect)
+                    scheme_rect = draw_scheme(scheme_rect)
+                    pygame.display.flip()
                     click_sound()
                 elif 190 <= x <= 570 and 700 <= y <= 780:
-                    # здесь задаются начальные координаты змейки
-                    snake_coords = [(0, 0), (1, 0)]
+                    # начальные координаты змейки задаются клеткой появления уровня
+                    level, snake_coords = load_level_and_spawn(level_name(curlevel))
                     click_sound()
                     return level, curlevel + 1, snake_coords
             elif event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_ESCAPE:
                     reset_sprites()
                     return 'escape', 0, 0  # выход на главный экран
-        generate_scheme(level)
-        mini_tiles_group.draw(screen)
-        pygame.display.flip()
-        clock.tick(START_SCREENS_FPS)
 
 
-def generate_level(level, snake):
-    Border(0, 0, 0, HEIGHT - 50)
-    Border(WIDTH, 0, WIDTH, HEIGHT - 50)
-    Border(0, 0, WIDTH, 0)
-    Border(0, HEIGHT - 50, WIDTH, HEIGHT - 50)
-    for y in range(len(level)):
-        for x in range(len(level[0])):
-            if level[y][x] == '.':
-                Tile('empty', x, y)
-            elif level[y][x] == '#':
-                Tile('wall', x, y)
-            elif level[y][x] == '@':
-                Tile('empty', x, y)
-                Apple(x, y)
-    for i in range(len(snake.snake_coords)):
-        x, y = snake.snake_coords[i][0], snake.snake_coords[i][1]
-        max_x_y = len(level) - 1
-        if i == 0:
-            next_x, next_y = snake.snake_coords[i + 1][0], snake.snake_coords[i + 1][1]
-            if not (x == 0 and next_x == max_x_y) and (x < next_x or (x == max_x_y and next_x == 0)):
-                SnakePart('end_left', x, y)
-            elif x > next_x or (x == 0 and next_x == max_x_y):
-                SnakePart('end_right', x, y)
-            elif not (y == 0 and next_y == max_x_y) and (y < next_y or (y == max_x_y and next_y == 0)):
-                SnakePart('end_up', x, y)
-            elif y > next_y or (y == 0 and next_y == max_x_y):
-                SnakePart('end_down', x, y)
-        elif i == len(snake.snake_coords) - 1:
-            if snake.direction == 'right':
-                SnakePart('head_right', x, y)
-            elif snake.direction == 'left':
-                SnakePart('head_left', x, y)
-            elif snake.direction == 'up':
-                SnakePart('head_up', x, y)
-            elif snake.direction == 'down':
-                SnakePart('head_down', x, y)
+# хвост по направлению к следующему куску и тело по направлениям к соседним кускам
+END_PARTS = {UP: 'end_down', RIGHT: 'end_left', DOWN: 'end_up', LEFT: 'end_right'}
+BODY_PARTS = {frozenset((UP, DOWN)): 'vertical',
+              frozenset((LEFT, RIGHT)): 'horizontal',
+              frozenset((RIGHT, DOWN)): 'angle1',
+              frozenset((RIGHT, UP)): 'angle2',
+              frozenset((LEFT, DOWN)): 'angle3',
+              frozenset((LEFT, UP)): 'angle4'}
+
+
+def snake_part_type(snake, cell, prev_cell, next_cell):
+    # возвращает название спрайта куска змейки по соседним кускам (None у хвоста и головы)
+    if next_cell is None:
+        return 'head_' + DIRECTION_NAMES[snake.direction]
+    to_next = snake.direction_to(cell, next_cell)
+    if prev_cell is None:
+        return END_PARTS[to_next]
+    to_prev = snake.direction_to(cell, prev_cell)
+    return BODY_PARTS.get(frozenset((to_prev, to_next)))
+
+
+class LevelRenderer:
+    # Стены и пол уровня рисуются в куски фона по CHUNK_SIZE клеток, куски строятся при первом
+    # показе и вытесняются давно не показанные, а каждый кадр перерисовываются только изменившиеся клетки.
+    # Уровень больше экрана показывается окном VIEW_CELLS клеток, которое следует за головой,
+    # с переходом через края поля. Клетки в методах - координаты уровня, на экран их переводит screen_position.
+    # Голова и хвост между ходами рисуются сдвинутыми на долю клетки, чтобы змейка двигалась плавно
+    def __init__(self, screen, level):
+        self.screen = screen
+        self.level = level
+        self.width = len(level[0])
+        self.height = len(level)
+        self.positions = None  # индекс кусков змейки, строится только при необходимости
+        self.parts = None  # клетка змейки -> название её изображения, после хода обновляется в move_parts
+        self.motion = None  # (шея, клетка, которую освободил хвост) последнего хода, None - змейка стоит
+        self.motion_drawn = set()  # клетки, на которых в прошлом кадре рисовались движущиеся голова и хвост
+        self.images = {name: get_scaled_image(name, TILE_SIZE) for name in list(snake_images) + list(other_images)}
+        self.chunks = OrderedDict()  # (x, y) куска -> поверхность, в конце недавно показанные
+        self.view_width = min(self.width, VIEW_CELLS[0])
+        self.view_height = min(self.height, VIEW_CELLS[1])
+        self.camera = (0, 0)  # клетка уровня в левом верхнем углу экрана
+        self.board_rect = pygame.Rect(0, 0, self.view_width * TILE_SIZE, self.view_height * TILE_SIZE)
+        # клетки поля под подсказками и полоса экрана под полем
+        self.hud_cells = set(self.cells_under(HUD_RECT))
+        self.hud_strip = pygame.Rect(0, self.board_rect.height, WIDTH, HEIGHT - self.board_rect.height)
+        # частицы не вылетают за поле уровня
+        particles.bounds = self.board_rect.copy()
+
+    def chunk(self, chunk_x, chunk_y):
+        key = (chunk_x, chunk_y)
+        if key in self.chunks:
+            self.chunks.move_to_end(key)
+            return self.chunks[key]
+        left = chunk_x * CHUNK_SIZE
+        top = chunk_y * CHUNK_SIZE
+        width = min(CHUNK_SIZE, self.width - left)
+        height = min(CHUNK_SIZE, self.height - top)
+        surface = pygame.Surface((width * TILE_SIZE, height * TILE_SIZE))
+        for y in range(height):
+            row = self.level[top + y]
+            for x in range(width):
+                tile_type = 'wall' if row[left + x] == '#' else 'empty'
+                surface.blit(self.images[tile_type], (x * TILE_SIZE, y * TILE_SIZE))
+        self.chunks[key] = surface
+        if len(self.chunks) > CHUNK_CACHE_SIZE:
+            self.chunks.popitem(last=False)
+        return surface
+
+    def follow(self, cell):
+        # сдвигает окно так, чтобы клетка была не ближе CAMERA_MARGIN к его краю,
+        # возвращает True, если окно сдвинулось и поле нужно перерисовать целиком
+        camera_x, camera_y = self.camera
+        x, y = cell
+        if self.view_width < self.width and not (
+                CAMERA_MARGIN <= (x - camera_x) % self.width < self.view_width - CAMERA_MARGIN):
+            camera_x = (x - self.view_width // 2) % self.width
+        if self.view_height < self.height and not (
+                CAMERA_MARGIN <= (y - camera_y) % self.height < self.view_height - CAMERA_MARGIN):
+            camera_y = (y - self.view_height // 2) % self.height
+        if (camera_x, camera_y) == self.camera:
+            return False
+        self.camera = (camera_x, camera_y)
+        self.hud_cells = set(self.cells_under(HUD_RECT))
+        return True
+
+    def screen_position(self, cell):
+        # левый верхний угол клетки на экране, None - клетка вне окна
+        x = (cell[0] - self.camera[0]) % self.width
+        y = (cell[1] - self.camera[1]) % self.height
+        if x < self.view_width and y < self.view_height:
+            return x * TILE_SIZE, y * TILE_SIZE
+        return None
+
+    def view_spans(self, start, count, size):
+        # отрезок окна [start, start + count) по одной оси, разбитый на куски без перехода через
+        # край уровня и границы кусков фона: (первая клетка уровня, первая клетка окна, длина)
+        spans = []
+        i = 0
+        while i < count:
+            cell = (start + i) % size
+            length = min(count - i, size - cell, CHUNK_SIZE - cell % CHUNK_SIZE)
+            spans.append((cell, i, length))
+            i += length
+        return spans
+
+    def draw_level(self, level, snake):
+        # полная перерисовка поля в окне
+        columns = self.view_spans(self.camera[0], self.view_width, self.width)
+        for top, screen_y, height in self.view_spans(self.camera[1], self.view_height, self.height):
+            for left, screen_x, width in columns:
+                chunk = self.chunk(left // CHUNK_SIZE, top // CHUNK_SIZE)
+                area = pygame.Rect(left % CHUNK_SIZE * TILE_SIZE, top % CHUNK_SIZE * TILE_SIZE,
+                                   width * TILE_SIZE, height * TILE_SIZE)
+                self.screen.blit(chunk, (screen_x * TILE_SIZE, screen_y * TILE_SIZE), area)
+        moving = self.moving_cells(snake)
+        parts = self.snake_parts(snake)
+        camera_x, camera_y = self.camera
+        for screen_y in range(self.view_height):
+            y = (camera_y + screen_y) % self.height
+            row = level[y]
+            for screen_x in range(self.view_width):
+                x = (camera_x + screen_x) % self.width
+                position = (screen_x * TILE_SIZE, screen_y * TILE_SIZE)
+                if row[x] == '@':
+                    self.screen.blit(self.images['apple'], position)
+                if (x, y) in parts and (x, y) not in moving:
+                    self.screen.blit(self.images[parts[x, y]], position)
+
+    def draw_cells(self, level, snake, cells):
+        # перерисовка только переданных клеток, возвращает список изменённых прямоугольников
+        rects = []
+        moving = self.moving_cells(snake)
+        parts = self.snake_parts(snake)
+        for x, y in set(cells):
+            if not (0 <= y < self.height and 0 <= x < self.width):
+                continue
+            position = self.screen_position((x, y))
+            if position is None:
+                continue
+            rect = pygame.Rect(position, (TILE_SIZE, TILE_SIZE))
+            self.screen.blit(self.chunk(x // CHUNK_SIZE, y // CHUNK_SIZE), rect,
+                             (x % CHUNK_SIZE * TILE_SIZE, y % CHUNK_SIZE * TILE_SIZE, TILE_SIZE, TILE_SIZE))
+            if level[y][x] == '@':
+                self.screen.blit(self.images['apple'], rect)
+            if (x, y) in parts and (x, y) not in moving:
+                self.screen.blit(self.images[parts[x, y]], rect)
+            rects.append(rect)
+        return rects
+
+    def snake_parts(self, snake):
+        # изображения всех кусков змейки считаются один раз, дальше их поддерживает move_parts
+        if self.parts is None:
+            coords = list(snake.snake_coords)
+            self.parts = {}
+            for i, cell in enumerate(coords):
+                prev_cell = coords[i - 1] if i > 0 else None
+                next_cell = coords[i + 1] if i < len(coords) - 1 else None
+                part_type = snake_part_type(snake, cell, prev_cell, next_cell)
+                if part_type is not None:
+                    self.parts[cell] = part_type
+        return self.parts
+
+    def move_parts(self, snake):
+        # вызывается после каждого хода: меняются только голова, шея, хвост и клетка, которую
+        # освободил хвост, поэтому обновление не зависит от длины змейки
+        self.positions = None
+        if self.parts is None:
+            return
+        for cell in snake.changed_cells:
+            part_type = self.part_at(snake, cell) if cell in snake.occupied else None
+            if part_type is None:
+                self.parts.pop(cell, None)
+            else:
+                self.parts[cell] = part_type
+
+    def part_at(self, snake, cell):
+        # голова, шея и хвост находятся сразу, для остальных кусков строится индекс по змейке
+        coords = snake.snake_coords
+        if cell == coords[-1]:
+            i = len(coords) - 1
+        elif cell == coords[0]:
+            i = 0
+        elif cell == coords[-2]:
+            i = len(coords) - 2
         else:
-            next_x, next_y = snake.snake_coords[i + 1][0], snake.snake_coords[i + 1][1]
-            prev_x, prev_y = snake.snake_coords[i - 1][0], snake.snake_coords[i - 1][1]
-            # если змейка заходит за границы, меняем значения координат следующего/прошлого куска в переменных
-            if x == 0 and next_x == max_x_y:
-                next_x = -1
-            elif x == 0 and prev_x == max_x_y:
-                prev_x = -1
-            elif x == max_x_y and next_x == 0:
-                next_x = x + 1
-            elif x == max_x_y and prev_x == 0:
-                prev_x = x + 1
-            if y == 0 and next_y == max_x_y:
-                next_y = -1
-            elif y == 0 and prev_y == max_x_y:
-                prev_y = -1
-            elif y == max_x_y and next_y == 0:
-                next_y = y + 1
-            elif y == max_x_y and prev_y == 0:
-                prev_y = y + 1
-
-            if prev_x == x == next_x:
-                SnakePart('vertical', x, y)
-            elif prev_y == y == next_y:
-                SnakePart('horizontal', x, y)
-            elif (prev_x < x and y < next_y) or (next_x < x and y < prev_y):
-                SnakePart('angle3', x, y)
-            elif (prev_y > y and x < next_x) or (next_y > y and x < prev_x):
-                SnakePart('angle1', x, y)
-            elif (prev_y < y and x > next_x) or (next_y < y and x > prev_x):
-                SnakePart('angle4', x, y)
-            elif (prev_x > x and y > next_y) or (next_x > x and y > prev_y):
-                SnakePart('angle2', x, y)
-
-
-def create_apple(level, snake):
-    snake_coords = snake.snake_coords
-    free_cells = []
-    rows = len(level)
-    cols = len(level[0])
-
-    for row in range(rows):
-        for col in range(cols):
-            if level[row][col] == '.' and (row, col) not in snake_coords:
-                free_cells.append((row, col))
-
-    # Случайно выбираем одну из свободных клеток
-    if free_cells:
-        apple_row, apple_col = random.choice(free_cells)
-        level[apple_row][apple_col] = '@'
-        return False
-    return True  # победа если нет места для яблока
+            if self.positions is None:
+                self.positions = {part: i for i, part in enumerate(coords)}
+            i = self.positions[cell]
+        prev_cell = coords[i - 1] if i > 0 else None
+        next_cell = coords[i + 1] if i < len(coords) - 1 else None
+        return snake_part_type(snake, cell, prev_cell, next_cell)
+
+    def start_motion(self, snake):
+        # запоминает, откуда пришли голова и хвост на последнем ходу
+        self.motion = (snake.snake_coords[-2], snake.previous_tail)
+
+    def stop_motion(self):
+        self.motion = None
+
+    def moving_cells(self, snake):
+        # клетки головы и хвоста, которые рисует draw_motion, а не draw_cells
+        if self.motion is None:
+            return ()
+        if self.motion[1] is None:
+            return (snake.snake_coords[-1],)
+        return snake.snake_coords[-1], snake.snake_coords[0]
+
+    def motion_cells(self, snake):
+        # клетки, которые нужно перерисовать в кадре под движущимися головой и хвостом
+        cells = list(self.motion_drawn)
+        if self.motion is not None:
+            cells += self.moving_cells(snake)
+            cells += [cell for cell in self.motion if cell is not None]
+        return cells
+
+    def draw_motion(self, snake, alpha):
+        # рисует голову и хвост на доле alpha пути из прошлых клеток в текущие
+        self.motion_drawn = set()
+        if self.motion is None:
+            return
+        neck, previous_tail = self.motion
+        coords = snake.snake_coords
+        shift = (min(alpha, 1) - 1) * TILE_SIZE
+        self.screen.set_clip(self.board_rect)  # при переходе через край поля не рисуем на подсказках
+        head_position = self.screen_position(coords[-1])
+        if head_position is not None:
+            dx, dy = DIRECTION_VECTORS[snake.direction]
+            self.screen.blit(self.images[self.snake_parts(snake)[coords[-1]]],
+                             (head_position[0] + dx * shift, head_position[1] + dy * shift))
+        self.motion_drawn.update((coords[-1], neck))
+        if previous_tail is not None:
+            tail_position = self.screen_position(coords[0])
+            if tail_position is not None:
+                dx, dy = DIRECTION_VECTORS[snake.direction_to(previous_tail, coords[0])]
+                self.screen.blit(self.images[self.snake_parts(snake)[coords[0]]],
+                                 (tail_position[0] + dx * shift, tail_position[1] + dy * shift))
+            self.motion_drawn.update((coords[0], previous_tail))
+        self.screen.set_clip(None)
+
+    def cells_under(self, rect):
+        # клетки уровня, которые в окне задевает прямоугольник экрана
+        return self.screen_cells([(x, y) for x in range(rect.left // TILE_SIZE, (rect.right - 1) // TILE_SIZE + 1)
+                                  for y in range(rect.top // TILE_SIZE, (rect.bottom - 1) // TILE_SIZE + 1)])
+
+    def screen_cells(self, cells):
+        # клетки экрана (номера плиток от левого верхнего угла) в клетки уровня
+        camera_x, camera_y = self.camera
+        return [((camera_x + x) % self.width, (camera_y + y) % self.height) for x, y in cells
+                if 0 <= x < self.view_width and 0 <= y < self.view_height]
 
 
 def draw_score(number, screen):
-    font = pygame.font.Font('data/segoeprint.ttf', 28)
-    string_rendered = font.render(f'Очки: {number}', 1, (255, 106, 0))
+    string_rendered = render_text(f'Очки: {number}', 28, (255, 106, 0))
     intro_rect = string_rendered.get_rect()
     intro_rect.top = 755
     intro_rect.x = 575
@@ -572,19 +838,8 @@ def draw_score(number, screen):
 
 
 def draw_record(difficulty, level_num, screen):
-    difficulty_num = '1'
-    if difficulty == 'easy':
-        difficulty_num = '1'
-    elif difficulty == 'normal':
-        difficulty_num = '2'
-    elif difficulty == 'hard':
-        difficulty_num = '3'
-    with open('stats.txt', 'r', encoding='UTF-8') as file:
-        lines = file.readlines()
-    line_number = level_num + int(difficulty_num) - 1 + (int(difficulty_num) - 1) * 10
-    number = int(lines[line_number].rstrip().split(':')[1][1:])
-    font = pygame.font.Font('data/segoeprint.ttf', 20)
-    string_rendered = font.render(f'Рекорд: {number}', 1, (255, 106, 0))
+    number = records.get(difficulty, level_num)
+    string_rendered = render_text(f'Рекорд: {number}', 20, (255, 106, 0))
     intro_rect = string_rendered.get_rect()
     intro_rect.top = 740
     intro_rect.x = 575
@@ -592,11 +847,10 @@ def draw_record(difficulty, level_num, screen):
 
 
 def draw_pause_hints(screen, pause_flag):
-    font = pygame.font.Font('data/segoeprint.ttf', 20)
     if not pause_flag:
-        string_rendered = font.render(f"Нажмите 'p' для паузы", 1, (255, 106, 0))
+        string_rendered = render_text(f"Нажмите 'p' для паузы", 20, (255, 106, 0))
     else:
-        string_rendered = font.render(f"ПАУЗА", 1, (255, 106, 0))
+        string_rendered = render_text(f"ПАУЗА", 20, (255, 106, 0))
     intro_rect = string_rendered.get_rect()
     intro_rect.top = 740
     if not pause_flag:
@@ -606,58 +860,117 @@ def draw_pause_hints(screen, pause_flag):
     screen.blit(string_rendered, intro_rect)
 
 
+def draw_autopilot_hint(screen, autopilot_flag):
+    if not autopilot_flag:
+        string_rendered = render_text("Нажмите 'a' для автопилота", 20, (255, 106, 0))
+    else:
+        string_rendered = render_text("АВТОПИЛОТ", 20, (255, 106, 0))
+    intro_rect = string_rendered.get_rect()
+    intro_rect.top = 764
+    intro_rect.x = 0
+    screen.blit(string_rendered, intro_rect)
+
+
 def draw_game_over_hints(screen):
-    font = pygame.font.Font('data/segoeprint.ttf', 20)
-    string_rendered = font.render(f"Нажмите 'r', чтобы переиграть", 1, (255, 106, 0))
+    string_rendered = render_text(f"Нажмите 'r', чтобы переиграть", 20, (255, 106, 0))
     intro_rect = string_rendered.get_rect()
     intro_rect.top = 740
     intro_rect.x = 0
     screen.blit(string_rendered, intro_rect)
-    string_rendered = font.render(f"Нажмите 'ESC', чтобы выйти на главный экран", 1, (255, 106, 0))
+    string_rendered = render_text(f"Нажмите 'ESC', чтобы выйти на главный экран", 20, (255, 106, 0))
     intro_rect = string_rendered.get_rect()
     intro_rect.top = 764
     intro_rect.x = 0
     screen.blit(string_rendered, intro_rect)
 
 
-def update_stats(difficulty, level_num, score):
-    difficulty_num = '1'
-    if difficulty == 'easy':
-        difficulty_num = '1'
-    elif difficulty == 'normal':
-        difficulty_num = '2'
-    elif difficulty == 'hard':
-        difficulty_num = '3'
-    with open('stats.txt', 'r', encoding='UTF-8') as file:
-        # Прочитаем файл целиком и сохраним каждую строку в список
-        lines = file.readlines()
-    new_line = f'{level_num} уровень: {score}\n'
-    line_number = level_num + int(difficulty_num) - 1 + (int(difficulty_num) - 1) * 10
-    try:
-        if int(lines[line_number].rstrip().split(':')[1][1:]) >= score:
+LEVELS_COUNT = 10  # уровней на каждой сложности
+STATS_HEADERS = {'easy': 'Легкий уровень сложности',
+                 'normal': 'Средниий уровень сложности',
+                 'hard': 'Тяжелый уровень сложности'}
+
+
+class Records:
+    # Рекорды читаются из файла один раз и хранятся в памяти по ключу (сложность, уровень).
+    # Файл перезаписывается только при завершении игры через временный файл
+    def __init__(self, filename='stats.txt'):
+        self.filename = filename
+        self.table = {(difficulty, level_num): 0 for difficulty in STATS_HEADERS
+                      for level_num in range(1, LEVELS_COUNT + 1)}
+        self.changed_flag = False
+        self.load()
+
+    def load(self):
+        if not os.path.isfile(self.filename):
+            self.changed_flag = True
             return
-        lines[line_number] = new_line
-    except IndexError:
-        print(f'Ошибка: Строка {line_number} отсутствует.')
-    with open('stats.txt', 'w', encoding='UTF-8') as file:
-        file.writelines(lines)
+        # строки разбираются по заголовкам сложностей, а не по номерам строк,
+        # поэтому файл с пропущенными или лишними строками приводится к обычному виду при сохранении
+        headers = {header: difficulty for difficulty, header in STATS_HEADERS.items()}
+        difficulty = None
+        with open(self.filename, 'r', encoding='UTF-8') as file:
+            for line in file:
+                line = line.strip()
+                if line in headers:
+                    difficulty = headers[line]
+                elif difficulty is not None and ':' in line:
+                    level_text, score_text = line.split(':', 1)
+                    try:
+                        level_num = int(level_text.split()[0])
+                        score = int(score_text)
+                    except (ValueError, IndexError):
+                        print(f'Ошибка: не удалось разобрать строку рекордов "{line}"')
+                        self.changed_flag = True
+                        continue
+                    self.table[(difficulty, level_num)] = score
+                elif line:
+                    self.changed_flag = True
+
+    def get(self, difficulty, level_num):
+        return self.table.get((difficulty, level_num), 0)
+
+    def update(self, difficulty, level_num, score):
+        if score > self.get(difficulty, level_num):
+            self.table[(difficulty, level_num)] = score
+            self.changed_flag = True
+
+    def lines(self):
+        lines = []
+        for difficulty, header in STATS_HEADERS.items():
+            lines.append(header)
+            for level_num in range(1, LEVELS_COUNT + 1):
+                lines.append(f'{level_num} уровень: {self.get(difficulty, level_num)}')
+        return lines
+
+    def save(self):
+        if not self.changed_flag:
+            return
+        temp_filename = self.filename + '.tmp'
+        with open(temp_filename, 'w', encoding='UTF-8') as file:
+            file.write('\n'.join(self.lines()))
+            # данные должны оказаться на диске до подмены, иначе после отключения питания
+            # переименование может сохраниться, а содержимое - нет
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_filename, self.filename)
+        self.changed_flag = False
+
 
+records = None  # загружаются в App
 
-def stats_screen(screen, clock):
-    with open('stats.txt', 'r', encoding='UTF-8') as file:
-        lines = file.readlines()
-    intro_text = [line.rstrip() for line in lines]
+
+def stats_screen(screen):
+    intro_text = records.lines()
     easy = intro_text[0:11]
     normal = intro_text[11:22]
     hard = intro_text[22:33]
 
-    font = pygame.font.Font('data/segoeprint.ttf', 20)
     stats_color = (255, 106, 0)
 
     def draw(x, start_y, text_list, color):
         text_coord = start_y
         for line in text_list:
-            string_rendered = font.render(line, 1, color)
+            string_rendered = render_text(line, 20, color)
             intro_rect = string_rendered.get_rect()
             text_coord += 1
             intro_rect.top = text_coord
@@ -669,35 +982,25 @@ def stats_screen(screen, clock):
     draw(400, 0, normal, stats_color)
     draw(200, 400, hard, stats_color)
     draw(425, 760, ['Нажмите ESC, чтобы выйти'], (255, 255, 0))
+    pygame.display.flip()
 
     while True:
-        for event in pygame.event.get():
+        for event in wait_events():
             if event.type == pygame.QUIT:
                 terminate()
             elif event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_ESCAPE:
-                    reset_sprites()
                     return  # выход на главный экран
-        pygame.display.flip()
-        clock.tick(START_SCREENS_FPS)
 
 
 def settings_screen(screen, clock):
-    fon = pygame.transform.scale(load_image('settings_screen.jpg'), (WIDTH, HEIGHT))
-    screen.blit(fon, (0, 0))
-    current_sprite_sheet = 0
-    current_empty_image = 0
-    current_apple_image = 0
-    current_wall_image = 0
-    snake_changed_flag = True
-
-    def load_sprites(current_sprite_sheet, current_empty_image, current_apple_image, current_wall_image):
-        cut_sheet(load_image(sprites_sheets[current_sprite_sheet]), 5, 4)
-        other_images['empty'] = load_image(empty_images[current_empty_image])
-        other_images['apple'] = load_image(apple_images[current_apple_image])
-        other_images['wall'] = load_image(wall_images[current_wall_image])
-
-    def draw_sprites():
+    fon = assets.screen_image('settings_screen.jpg')
+    current_sprite_sheet, current_empty_image, current_apple_image, current_wall_image = themes.selection
+
+    def draw_sprites(sheet_changed):
+        # образцы темы перерисовываются только после смены выбора
+        screen.blit(fon, (0, 0))
+        reset_sprites()
         SnakePart('end_left', 1, 2, scaled=False)
         SnakePart('horizontal', 2, 2, scaled=False)
         SnakePart('head_right', 3, 2, scaled=False)
@@ -705,14 +1008,25 @@ def settings_screen(screen, clock):
         Apple(2, 9, scaled=False)
         Tile('wall', 2, 12, scaled=False)
         all_sprites.draw(screen)
-        if snake_changed_flag:
+        if sheet_changed or not animated_group:
             for spr in animated_group:
                 spr.kill()
             AnimatedSnakeShowcase(10.5, 2)
-        else:
-            animated_group.update()
         animated_group.draw(screen)
 
+    def draw_showcase():
+        # анимированная змейка - единственное, что меняется на экране каждый кадр
+        rects = []
+        for spr in animated_group:
+            screen.blit(fon, spr.rect, spr.rect)
+            rects.append(spr.rect.copy())
+        animated_group.update()
+        animated_group.draw(screen)
+        return rects
+
+    draw_sprites(True)
+    pygame.display.flip()
+
     while True:
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
@@ -725,7 +1039,6 @@ def settings_screen(screen, clock):
                             current_sprite_sheet = len(sprites_sheets) - 1
                         else:
                             current_sprite_sheet -= 1
-                        snake_changed_flag = True
                         click_sound()
                     elif 190 <= y <= 245:
                         if current_empty_image == 0:
@@ -751,7 +1064,6 @@ def settings_screen(screen, clock):
                             current_sprite_sheet = 0
                         else:
                             current_sprite_sheet += 1
-                        snake_changed_flag = True
                         click_sound()
                     elif 190 <= y <= 245:
                         if current_empty_image == len(empty_images) - 1:
@@ -776,148 +1088,460 @@ def settings_screen(screen, clock):
                     current_sprite_sheet, current_empty_image, current_apple_image, current_wall_image = 0, 0, 0, 0
             elif event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_ESCAPE:
-                    reset_sprites()
                     return  # выход на главный экран
-        pygame.display.flip()
-        reset_sprites()
-        screen.fill((0, 0, 0))
-        screen.blit(fon, (0, 0))
-        load_sprites(current_sprite_sheet, current_empty_image, current_apple_image, current_wall_image)
-        draw_sprites()
-        snake_changed_flag = False
+        sheet_changed = themes.selection[0] != current_sprite_sheet
+        if themes.select(current_sprite_sheet, current_empty_image, current_apple_image, current_wall_image):
+            draw_sprites(sheet_changed)
+            pygame.display.flip()
+        else:
+            pygame.display.update(draw_showcase())
         clock.tick(START_SCREENS_FPS)
 
 
-def play():
-    global music_menu_flag
-    pygame.init()
-    pygame.mixer.init()
-    screen = pygame.display.set_mode((WIDTH, HEIGHT))
-    screen.fill((0, 0, 0))
-    pygame.display.set_caption('Twisty Zapper')
-    clock = pygame.time.Clock()
+PROFILER_STAGES = ['events', 'move', 'stats', 'particles', 'level', 'draw', 'hud', 'display']
+PROFILER_FRAMES = 600  # кадров в кольцевом буфере профайлера
+PROFILER_CSV = 'frame_times.csv'
+
+
+class FrameProfiler:
+    # Время стадий каждого кадра игры в кольцевом буфере на последние PROFILER_FRAMES кадров.
+    # По F3 поверх поля показываются p50/p95/p99 стадий, при выходе буфер записывается в CSV
+    def __init__(self, stages=PROFILER_STAGES, frames_count=PROFILER_FRAMES):
+        self.stages = stages
+        self.stage_index = {stage: i for i, stage in enumerate(stages)}
+        self.times = [[0.0] * len(stages) for _ in range(frames_count)]
+        self.position = 0  # строка буфера для текущего кадра
+        self.frames_recorded = 0
+        self.last_mark = 0.0
+        self.visible = False
+        self.font = pygame.font.Font(None, 20)
+        self.rect = pygame.Rect(5, 5, 300, 22 + 18 * len(stages))
+
+    def start_frame(self):
+        row = self.times[self.position]
+        for i in range(len(row)):
+            row[i] = 0.0
+        self.last_mark = time.perf_counter()
+
+    def mark(self, stage):
+        # время с прошлой отметки добавляется к стадии
+        now = time.perf_counter()
+        self.times[self.position][self.stage_index[stage]] += now - self.last_mark
+        self.last_mark = now
+
+    def end_frame(self):
+        self.position = (self.position + 1) % len(self.times)
+        self.frames_recorded = min(self.frames_recorded + 1, len(self.times))
+
+    def rows(self):
+        # записанные кадры от старых к новым
+        if self.frames_recorded < len(self.times):
+            return self.times[:self.frames_recorded]
+        return self.times[self.position:] + self.times[:self.position]
+
+    def percentiles(self, stage):
+        values = sorted(row[self.stage_index[stage]] for row in self.rows())
+        if not values:
+            return 0.0, 0.0, 0.0
+        return tuple(values[min(len(values) - 1, int(len(values) * p))] * 1000 for p in (0.5, 0.95, 0.99))
+
+    def draw(self, screen):
+        screen.fill((20, 20, 20), self.rect)
+        lines = [['мс', 'p50', 'p95', 'p99']]
+        for stage in self.stages:
+            lines.append([stage] + [f'{value:.2f}' for value in self.percentiles(stage)])
+        for i, line in enumerate(lines):
+            for column, text in zip((5, 120, 180, 240), line):
+                screen.blit(self.font.render(text, 1, (255, 255, 0)),
+                            (self.rect.x + column, self.rect.y + 4 + 18 * i))
+        return self.rect
+
+    def save_csv(self, filename=None):
+        # по умолчанию в PROFILER_CSV, имя берётся при вызове, чтобы замеры могли его подменить
+        import csv
+        filename = filename or PROFILER_CSV
+        rows = self.rows()
+        if not rows:
+            return
+        with open(filename, 'w', newline='', encoding='UTF-8') as file:
+            writer = csv.writer(file)
+            writer.writerow(['frame'] + [f'{stage}_ms' for stage in self.stages])
+            for frame, row in enumerate(rows):
+                writer.writerow([frame] + [f'{value * 1000:.4f}' for value in row])
+
+
+def show_first_frame(screen):
+    # главное меню показывается сразу после запуска, остальное грузится в фоне уже после него
+    global first_frame_time, particles
+    screen.blit(assets.screen_image('menu_1.jpg'), (0, 0))
+    pygame.display.flip()
+    first_frame_time = time.perf_counter() - start_time
+    print(f'Первый кадр через {first_frame_time * 1000:.0f} мс')
+    assets.preload(themes.asset_keys() + [('sound', name) for name in sound_effects] +
+                   [('screen', name) for name in screen_images] +
+                   [('image', 'win_screen.jpg'), ('image', 'game_over_screen.jpg')])
+    themes.select(0, 0, 0, 0)
+    from particles import ParticleSystem  # вместе с numpy
+    particles = ParticleSystem(pygame.Rect(0, 0, WIDTH, HEIGHT - 50))
+
+
+def game_screen(screen, clock, difficulty, start_level, level_num, start_snake_coords):
+    # возвращает 'menu', если игрок вышел по ESC, или 'quit', если закрыл окно
+    from autopilot import Autopilot
+    from replay import Recorder
+    # от сложности зависит скорость змейки
     fps = 60
-    menu_music('menu_music.mp3', 0.1, music_menu_flag)
-    music_menu_flag = False
+    if difficulty == 'easy':
+        fps = 6
+    elif difficulty == 'normal':
+        fps = 9
+    elif difficulty == 'hard':
+        fps = 14
     pause_flag = False
     ongoing = 'continue'
-    mode = start_screen_1(screen, clock)
-    if mode == 'play':
-        difficulty = start_screen_2(screen, clock)  # от сложности зависит fps
-        if difficulty == 'escape':
-            reset_sprites()
-            return True  # конец функции play
-        if difficulty == 'easy':
-            fps = 6
-        elif difficulty == 'normal':
-            fps = 9
-        elif difficulty == 'hard':
-            fps = 14
-        start_level, level_num, start_snake_coords = start_screen_3(screen, clock, difficulty)
-        if start_level == 'escape':
-            return True  # конец функции play
-        level = [i[:] for i in start_level[:]]
-        for spr in mini_tiles_group:
-            spr.kill()
-        snake = Snake(start_snake_coords[:])
-        direction = 'right'
-        create_apple(level, snake)
-        running = True
-        snake_alive = True
-        game_over_flag = False
-        start_music('game_music.wav', 0.1)
-        while running:
-            clock.tick(fps)
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    running = False
-                if event.type == pygame.KEYDOWN:
+    # у каждой партии свой seed, он вместе с нажатиями сохраняется в запись игры
+    seed = int.from_bytes(os.urandom(8), 'little')
+    game = Engine(start_level, seed, start_snake_coords)
+    recorder = Recorder(start_level, seed, start_snake_coords, difficulty, level_num)
+    particles.seed(seed)
+    renderer = LevelRenderer(screen, game.level)
+    renderer.follow(game.snake.snake_coords[-1])
+    profiler = FrameProfiler()
+    input_queue = deque()  # направления, нажатые между ходами, по одному на ход
+    pilot = Autopilot()
+    autopilot_flag = False  # змейкой управляет автопилот
+    autopilot_used = False  # в партии был автопилот, её счёт не идёт в рекорды
+    step_time = 1000 / fps  # логика идёт с шагом, зависящим от сложности, а кадры рисуются с RENDER_FPS
+    accumulator = 0
+    redraw_flag = True  # нужна полная перерисовка кадра
+    hud_state = None
+    running = True
+    snake_alive = True
+    game_over_flag = False
+    start_music('game_music.wav', 0.1)
+
+    def draw_hud():
+        if game_over_flag:
+            draw_game_over_hints(screen)
+        else:
+            draw_pause_hints(screen, pause_flag)
+            draw_autopilot_hint(screen, autopilot_flag)
+        draw_score(game.snake.score, screen)
+        draw_record(difficulty, level_num, screen)
+
+    def save_replay():
+        # партия записывается один раз: при её конце, перезапуске или выходе
+        if recorder.ticks and not recorder.saved:
+            recorder.save(game)
+
+    def queue_direction(direction):
+        # поворот принимается, если он отличается от предыдущего и не разворачивает змейку назад
+        last_direction = input_queue[-1] if input_queue else game.snake.direction
+        if len(input_queue) < INPUT_QUEUE_SIZE and direction != last_direction and \
+                direction != (last_direction + 2) % 4:
+            input_queue.append(direction)
+
+    while running:
+        frame_time = clock.tick(RENDER_FPS)
+        accumulator += frame_time
+        profiler.start_frame()
+        # на паузе кадр не меняется, и цикл ждёт нажатий, а не крутится с RENDER_FPS
+        for event in wait_events() if pause_flag else pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            if event.type in WINDOW_REDRAW_EVENTS:
+                # окно было перекрыто или свёрнуто, обновления по клеткам его не восстановят
+                redraw_flag = True
+            if event.type == pygame.KEYDOWN:
+                if snake_alive and event.key in DIRECTION_KEYS:
+                    # нажатие стрелки возвращает управление игроку
+                    autopilot_flag = False
+                    queue_direction(DIRECTION_KEYS[event.key])
+                if event.key == pygame.K_r:
+                    # перезапуск уровня
+                    snake_alive = True
+                    game_over_flag = False
+                    pause_flag = False
+                    reset_sprites()
+                    input_queue.clear()
+                    autopilot_flag = False
+                    autopilot_used = False
+                    accumulator = 0
+                    save_replay()
+                    seed = int.from_bytes(os.urandom(8), 'little')
+                    game.reset(start_level, seed, start_snake_coords)
+                    recorder = Recorder(start_level, seed, start_snake_coords, difficulty, level_num)
+                    particles.seed(seed)
+                    renderer = LevelRenderer(screen, game.level)
+                    renderer.follow(game.snake.snake_coords[-1])
+                    redraw_flag = True
+                    start_music('game_music.wav', 0.1)
+                elif event.key == pygame.K_p:
+                    # пауза
                     if snake_alive:
-                        if event.key == pygame.K_LEFT:
-                            direction = 'left'
-                        elif event.key == pygame.K_RIGHT:
-                            direction = 'right'
-                        elif event.key == pygame.K_UP:
-                            direction = 'up'
-                        elif event.key == pygame.K_DOWN:
-                            direction = 'down'
-                    if event.key == pygame.K_r:
-                        # перезапуск уровня
-                        snake_alive = True
-                        game_over_flag = False
-                        pause_flag = False
-                        reset_sprites()
-                        direction = 'right'
-                        level = [i[:] for i in start_level[:]]
-                        snake = Snake(start_snake_coords[:])
-                        create_apple(level, snake)
-                        start_music('game_music.wav', 0.1)
-                    elif event.key == pygame.K_p:
-                        # пауза
-                        if snake_alive:
-                            if not pause_flag:
-                                pause_flag = True
-                                draw_pause_hints(screen, pause_flag)
-                            else:
-                                pause_flag = False
-                    elif event.key == pygame.K_ESCAPE:
-                        # выход на главный экран
-                        reset_sprites()
-                        pygame.mixer.music.stop()
-                        music_menu_flag = True
-                        return True  # конец функции play
-
-            if not pause_flag:
-                snake.change_direction(direction)
-                screen.fill((0, 0, 0))
-                generate_level(level, snake)
+                        if not pause_flag:
+                            pause_flag = True
+                            draw_pause_hints(screen, pause_flag)
+                            pygame.display.update(HUD_RECT)
+                        else:
+                            pause_flag = False
+                            accumulator = 0
+                            clock.tick()  # время паузы не считается временем кадра
+                            redraw_flag = True
+                elif event.key == pygame.K_a:
+                    # включить или выключить автопилот
+                    if snake_alive and not pause_flag:
+                        autopilot_flag = not autopilot_flag
+                        autopilot_used = autopilot_used or autopilot_flag
+                        input_queue.clear()
+                elif event.key == pygame.K_F3:
+                    # показать или скрыть время стадий кадра
+                    profiler.visible = not profiler.visible
+                    redraw_flag = True
+                elif event.key == pygame.K_ESCAPE:
+                    # выход на главный экран
+                    records.save()
+                    save_replay()
+                    profiler.save_csv()
+                    return 'menu'
+
+        profiler.mark('events')
+        if not pause_flag:
+            dirty_cells = []
+            steps = 0
+            while accumulator >= step_time:
+                # один ход логики
+                accumulator -= step_time
+                steps += 1
                 if snake_alive:
-                    ongoing = snake.move(level)
+                    if autopilot_flag:
+                        action = pilot.choose(game)
+                        if action == game.snake.direction:
+                            action = None  # в записи хранятся только повороты
+                    else:
+                        action = input_queue.popleft() if input_queue else None
+                    recorder.record(action)
+                    state, reward, ongoing = game.step(action)
+                    renderer.move_parts(game.snake)
+                    if ongoing == 'continue':
+                        renderer.start_motion(game.snake)
+                    if renderer.follow(state.head):
+                        # окно сдвинулось за головой
+                        redraw_flag = True
+                    if game.ate_apple:
+                        head_position = renderer.screen_position(state.head)
+                        if head_position is not None:
+                            spawn_particles_on_eat(*head_position)
+                        sound_bank.play('eat_food.mp3')
+                    dirty_cells += game.snake.changed_cells
+                    profiler.mark('move')
+                    if not autopilot_used:
+                        records.update(difficulty, level_num, state.score)
                 if ongoing == 'game_over' or ongoing == 'win':
                     snake_alive = False
                 if not snake_alive:
+                    renderer.stop_motion()
                     if not game_over_flag:
                         GameOver(type=ongoing)
                         pygame.mixer.music.stop()
-                        load_sound('game_over.mp3').play()
+                        sound_bank.play('game_over.mp3')
+                        records.save()
+                        save_replay()
                         game_over_flag = True
+                # пока экран проигрыша выезжает, кадр перерисовывается целиком
+                if any(spr.rect.x < 0 for spr in game_over_group):
+                    redraw_flag = True
                 game_over_group.update()
-                particle_group.update()
-                # Рисование всех спрайтов
-                all_sprites.draw(screen)
-                particle_group.draw(screen)
+                profiler.mark('stats')
+                if steps == MAX_STEPS_PER_FRAME:
+                    # игра не успевает, лишние ходы пропускаются, чтобы не копить отставание
+                    accumulator = 0
+                    break
+            if particles:
+                # частицы движутся каждый кадр, перерисовываются клетки под старым и новым местом
+                dirty_cells += renderer.screen_cells(particles.cells(TILE_SIZE))
+                particles.update(frame_time / 1000)
+                dirty_cells += renderer.screen_cells(particles.cells(TILE_SIZE))
+            profiler.mark('particles')
+            # доля пути от прошлой клетки к следующей для плавного движения головы и хвоста
+            alpha = accumulator / step_time
+            if redraw_flag:
+                # Рисование всего кадра
+                screen.fill((0, 0, 0))
+                renderer.draw_level(game.level, game.snake)
+                renderer.draw_motion(game.snake, alpha)
+                profiler.mark('level')
+                particles.draw(screen)
                 game_over_group.draw(screen)
-                if game_over_flag:
-                    draw_game_over_hints(screen)
-                else:
-                    draw_pause_hints(screen, pause_flag)
-                draw_score(snake.score, screen)
-                update_stats(difficulty, level_num, snake.score)
-                draw_record(difficulty, level_num, screen)
+                profiler.mark('draw')
+                draw_hud()
+                if profiler.visible:
+                    profiler.draw(screen)
+                profiler.mark('hud')
                 pygame.display.flip()
-                for spr in all_sprites:
-                    spr.kill()
+                redraw_flag = False
+                hud_state = (game.snake.score, game_over_flag, autopilot_flag)
             else:
-                draw_pause_hints(screen, pause_flag)
-                pygame.display.flip()
-    elif mode == 'stats':
-        screen.fill((0, 0, 0))
-        stats_screen(screen, clock)
+                rects = []
+                if not game_over_flag:
+                    # Рисование только изменившихся клеток
+                    dirty_cells += renderer.motion_cells(game.snake)
+                    hud_flag = hud_state != (game.snake.score, game_over_flag, autopilot_flag) or bool(
+                        renderer.hud_cells.intersection(dirty_cells))
+                    if hud_flag:
+                        dirty_cells += renderer.hud_cells
+                    rects = renderer.draw_cells(game.level, game.snake, dirty_cells)
+                    renderer.draw_motion(game.snake, alpha)
+                    profiler.mark('level')
+                    particles.draw(screen)
+                    profiler.mark('draw')
+                    if hud_flag:
+                        screen.fill((0, 0, 0), renderer.hud_strip)
+                        draw_hud()
+                        rects.append(HUD_RECT)
+                        hud_state = (game.snake.score, game_over_flag, autopilot_flag)
+                if profiler.visible:
+                    rects.append(profiler.draw(screen))
+                profiler.mark('hud')
+                pygame.display.update(rects)
+            profiler.mark('display')
+            profiler.end_frame()
+    # окно закрыто
+    records.save()
+    save_replay()
+    profiler.save_csv()
+    return 'quit'
+
+
+class Screen:
+    # Экран - состояние App. enter вызывается при переходе на экран, run крутит цикл экрана и возвращает
+    # (имя следующего экрана, аргументы его enter), exit вызывается при уходе с экрана
+    def __init__(self, app):
+        self.app = app
+
+    def enter(self):
+        pass
+
+    def exit(self):
+        pass
+
+
+class MenuScreen(Screen):
+    def enter(self):
+        global music_menu_flag
+        menu_music('menu_music.mp3', 0.1, music_menu_flag)
+        music_menu_flag = False
+
+    def run(self):
+        mode = start_screen_1(self.app.screen)
+        return {'play': 'difficulty', 'stats': 'stats', 'settings': 'settings'}[mode], {}
+
+
+class DifficultyScreen(Screen):
+    def run(self):
+        difficulty = start_screen_2(self.app.screen)
+        if difficulty == 'escape':
+            return 'menu', {}
+        return 'level_select', {'difficulty': difficulty}
+
+
+class LevelSelectScreen(Screen):
+    def enter(self, difficulty):
+        self.difficulty = difficulty
+
+    def run(self):
+        level, level_num, snake_coords = start_screen_3(self.app.screen, self.difficulty)
+        if level == 'escape':
+            return 'menu', {}
+        return 'game', {'difficulty': self.difficulty, 'level': level, 'level_num': level_num,
+                        'snake_coords': snake_coords}
+
+
+class GameScreen(Screen):
+    def enter(self, difficulty, level, level_num, snake_coords):
+        self.difficulty = difficulty
+        self.level = level
+        self.level_num = level_num
+        self.snake_coords = snake_coords
+
+    def run(self):
+        if game_screen(self.app.screen, self.app.clock, self.difficulty, self.level, self.level_num,
+                       self.snake_coords) == 'quit':
+            terminate()
+        return 'menu', {}
+
+    def exit(self):
+        global music_menu_flag
+        reset_sprites()
+        pygame.mixer.music.stop()
+        music_menu_flag = True
+        self.level = None
+
+
+class StatsScreen(Screen):
+    def enter(self):
+        self.app.screen.fill((0, 0, 0))
+
+    def run(self):
+        stats_screen(self.app.screen)
+        return 'menu', {}
+
+    def exit(self):
         reset_sprites()
-        return True  # конец функции play
-    elif mode == 'settings':
-        screen.fill((0, 0, 0))
-        settings_screen(screen, clock)
+
+
+class SettingsScreen(Screen):
+    def enter(self):
+        self.app.screen.fill((0, 0, 0))
+
+    def run(self):
+        settings_screen(self.app.screen, self.app.clock)
+        return 'menu', {}
+
+    def exit(self):
         reset_sprites()
         for spr in animated_group:
             spr.kill()
-        return True  # конец функции play
+
+
+class App:
+    # Приложение на весь запуск: окно, часы и микшер инициализируются один раз. Переход между экранами -
+    # exit старого и enter нового в одном цикле run, без рекурсии, поэтому стек и память не растут,
+    # сколько бы раз игрок ни возвращался в меню.
+    # Кэши assets, themes, level_thumbnails и объекты sound_bank, records остаются глобальными модуля:
+    # ими пользуются функции экранов, спрайты и подсказки по всему файлу. App только создаёт
+    # sound_bank и records, когда микшер уже инициализирован
+    def __init__(self):
+        global sound_bank, records
+        pygame.init()
+        pygame.mixer.init()
+        if sound_bank is None:
+            sound_bank = SoundBank()
+        if records is None:
+            records = Records()
+        self.screen = pygame.display.set_mode((WIDTH, HEIGHT))
+        self.screen.fill((0, 0, 0))
+        pygame.display.set_caption('Twisty Zapper')
+        self.clock = pygame.time.Clock()
+        if first_frame_time is None:
+            show_first_frame(self.screen)
+        self.screens = {'menu': MenuScreen(self), 'difficulty': DifficultyScreen(self),
+                        'level_select': LevelSelectScreen(self), 'game': GameScreen(self),
+                        'stats': StatsScreen(self), 'settings': SettingsScreen(self)}
+
+    def run(self, name='menu', **kwargs):
+        # работает, пока окно не закроют (terminate)
+        screen = self.screens[name]
+        screen.enter(**kwargs)
+        while True:
+            name, kwargs = screen.run()
+            screen.exit()
+            screen = self.screens[name]
+            screen.enter(**kwargs)
 
 
 def main():
-    retry = play()
-    if retry:
-        main()
+    App().run()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,109 @@
+# Частицы на массивах numpy: координаты, скорости, время жизни, размер и вид каждой частицы
+# лежат в заранее выделенных массивах, живые частицы занимают первые count элементов.
+# Частицы движутся по времени, а не по ходам змейки, и исчезают, выйдя за прямоугольник поля.
+# Рисуются одним вызовом blits квадратами, заготовленными для каждой пары (размер, цвет)
+import numpy as np
+import pygame
+
+CAPACITY = 65536  # сколько частиц может жить одновременно, лишние при создании отбрасываются
+
+
+class ParticleSystem:
+    def __init__(self, bounds, capacity=CAPACITY, seed=None):
+        self.bounds = pygame.Rect(bounds)  # частица удаляется, когда выходит за этот прямоугольник
+        self.capacity = capacity
+        self.count = 0
+        self.x = np.zeros(capacity, np.float32)  # левый верхний угол частицы
+        self.y = np.zeros(capacity, np.float32)
+        self.vel_x = np.zeros(capacity, np.float32)  # пикселей в секунду
+        self.vel_y = np.zeros(capacity, np.float32)
+        self.lifetime = np.zeros(capacity, np.float32)  # секунд до исчезновения
+        self.size = np.zeros(capacity, np.int16)
+        self.kind = np.zeros(capacity, np.int16)  # номер квадрата в self.surfaces
+        self.arrays = [self.x, self.y, self.vel_x, self.vel_y, self.lifetime, self.size, self.kind]
+        self.kinds = {}  # (размер, цвет) -> номер квадрата
+        self.surfaces = []
+        self.random = np.random.default_rng(seed)
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.count = 0
+
+    def seed(self, seed):
+        # частицы партии повторяются вместе с её записью
+        self.random = np.random.default_rng(seed)
+
+    def surface_kind(self, size, color):
+        key = (size, tuple(color))
+        if key not in self.kinds:
+            surface = pygame.Surface((size, size))
+            surface.fill(color)
+            if pygame.display.get_surface() is not None:
+                surface = surface.convert()
+            self.kinds[key] = len(self.surfaces)
+            self.surfaces.append(surface)
+        return self.kinds[key]
+
+    def spawn(self, center_x, center_y, color, count, sizes=(3, 9), lifetime=(0.5, 1.5),
+              speed_x=(-10, 20), speed_y=(-10, 20)):
+        # count частиц с центром в (center_x, center_y), размеры и время жизни - случайные из диапазонов
+        count = min(count, self.capacity - self.count)
+        if count <= 0:
+            return
+        start, end = self.count, self.count + count
+        rng = self.random
+        size = rng.integers(sizes[0], sizes[1] + 1, count)
+        self.size[start:end] = size
+        self.x[start:end] = center_x - size // 2
+        self.y[start:end] = center_y - size // 2
+        self.vel_x[start:end] = rng.uniform(speed_x[0], speed_x[1], count)
+        self.vel_y[start:end] = rng.uniform(speed_y[0], speed_y[1], count)
+        self.lifetime[start:end] = rng.uniform(lifetime[0], lifetime[1], count)
+        kinds = np.array([self.surface_kind(side, color) for side in range(sizes[0], sizes[1] + 1)], np.int16)
+        self.kind[start:end] = kinds[size - sizes[0]]
+        self.count = end
+
+    def update(self, dt):
+        # dt - прошедшее время в секундах
+        n = self.count
+        if not n:
+            return
+        x, y, size = self.x[:n], self.y[:n], self.size[:n]
+        x += self.vel_x[:n] * dt
+        y += self.vel_y[:n] * dt
+        self.lifetime[:n] -= dt
+        bounds = self.bounds
+        alive = ((self.lifetime[:n] > 0) & (x >= bounds.left) & (y >= bounds.top) &
+                 (x + size <= bounds.right) & (y + size <= bounds.bottom))
+        if not alive.all():
+            # живые частицы сдвигаются в начало массивов
+            indexes = np.flatnonzero(alive)
+            for array in self.arrays:
+                array[:len(indexes)] = array[indexes]
+            self.count = len(indexes)
+
+    def draw(self, screen):
+        n = self.count
+        if n:
+            surfaces = self.surfaces
+            screen.blits(zip(map(surfaces.__getitem__, self.kind[:n].tolist()),
+                             zip(self.x[:n].astype(np.int32).tolist(), self.y[:n].astype(np.int32).tolist())),
+                         doreturn=False)
+
+    def cells(self, tile_size):
+        # клетки поля, которые задевают частицы, частица меньше клетки и задевает не больше четырёх
+        n = self.count
+        if not n:
+            return []
+        left = self.x[:n].astype(np.int32)
+        top = self.y[:n].astype(np.int32)
+        right = (left + self.size[:n] - 1) // tile_size
+        bottom = (top + self.size[:n] - 1) // tile_size
+        left //= tile_size
+        top //= tile_size
+        width = int(max(right.max(), 0)) + 1
+        codes = np.unique(np.concatenate([top * width + left, top * width + right,
+                                          bottom * width + left, bottom * width + right]))
+        return list(zip((codes % width).tolist(), (codes // width).tolist()))
@@ -0,0 +1,188 @@
+# Запись игр и их воспроизведение без окна и звука.
+# Игра сохраняет каждую партию в replays/, проверить записи можно так:
+#   python replay.py replays/*.rpl
+# Воспроизведение повторяет партию на Engine с тем же seed, уровнем и нажатиями
+# и сверяет итог (ходы, счёт, статус, змейку) с записанным.
+#
+# Формат файла (little-endian): HEADER (MAGIC, версия, seed), сложность и номер уровня,
+# размеры уровня и сжатая zlib сетка, начальные клетки змейки, повороты - пары
+# (varint число ходов с прошлого поворота, направление), затем FOOTER с итогом партии
+import argparse
+import os
+import struct
+import sys
+import time
+import zlib
+
+from engine import Engine
+
+MAGIC = b'SNKR'
+VERSION = 1
+HEADER = struct.Struct('<4sBQ')
+FOOTER = struct.Struct('<IIIBI')  # ходов, счёт, длина змейки, статус, crc32 клеток змейки
+STATUSES = ['continue', 'game_over', 'win']
+REPLAYS_DIR = 'replays'
+REPLAYS_KEPT = 20  # сколько последних записей хранится, старые удаляются
+
+
+def snake_digest(snake):
+    # контрольная сумма клеток змейки от хвоста к голове
+    return zlib.crc32(b''.join(struct.pack('<II', x, y) for x, y in snake.snake_coords))
+
+
+class Recorder:
+    # запись одной партии: начальные условия и повороты по ходам
+    def __init__(self, level, seed, snake_coords, difficulty='', level_num=0):
+        self.level = [list(row) for row in level]  # сетка до начала игры, без яблока
+        self.seed = seed
+        self.snake_coords = list(snake_coords)
+        self.difficulty = difficulty
+        self.level_num = level_num
+        self.turns = []  # (номер хода, направление)
+        self.ticks = 0
+        self.saved = False
+
+    def record(self, action):
+        # вызывается перед каждым game.step с тем же action
+        if action is not None:
+            self.turns.append((self.ticks, action))
+        self.ticks += 1
+
+    def encode(self, game):
+        data = bytearray(HEADER.pack(MAGIC, VERSION, self.seed))
+        difficulty = self.difficulty.encode()
+        data += struct.pack('<B', len(difficulty)) + difficulty + struct.pack('<H', self.level_num)
+        grid = zlib.compress(''.join(''.join(row) for row in self.level).encode('ascii'))
+        data += struct.pack('<HHI', len(self.level[0]), len(self.level), len(grid)) + grid
+        data += struct.pack('<H', len(self.snake_coords))
+        for x, y in self.snake_coords:
+            data += struct.pack('<HH', x, y)
+        turns = bytearray()
+        last_tick = 0
+        for tick, direction in self.turns:
+            write_varint(turns, tick - last_tick)
+            turns.append(direction)
+            last_tick = tick
+        data += struct.pack('<II', len(self.turns), len(turns)) + turns
+        data += FOOTER.pack(self.ticks, game.snake.score, len(game.snake.snake_coords),
+                            STATUSES.index(game.status), snake_digest(game.snake))
+        return bytes(data)
+
+    def save(self, game, replays_dir=None, kept=REPLAYS_KEPT):
+        # сохраняет запись в replays_dir (по умолчанию REPLAYS_DIR) и удаляет старые, возвращает имя файла
+        self.saved = True
+        replays_dir = replays_dir or REPLAYS_DIR
+        os.makedirs(replays_dir, exist_ok=True)
+        now = time.time()
+        filename = os.path.join(replays_dir, time.strftime('%Y%m%d_%H%M%S', time.localtime(now)) +
+                                f'{int(now * 1000) % 1000:03d}_{self.difficulty}_{self.level_num}_{self.seed:016x}.rpl')
+        with open(filename, 'wb') as file:
+            file.write(self.encode(game))
+        old = sorted(name for name in os.listdir(replays_dir) if name.endswith('.rpl'))[:-kept]
+        for name in old:
+            os.remove(os.path.join(replays_dir, name))
+        return filename
+
+
+def write_varint(data, value):
+    while value >= 0x80:
+        data.append(value & 0x7f | 0x80)
+        value >>= 7
+    data.append(value)
+
+
+def read_varint(data, offset):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+class Replay:
+    # прочитанная запись партии
+    def __init__(self, data):
+        magic, version, self.seed = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'не запись игры версии {VERSION}')
+        offset = HEADER.size
+        length = data[offset]
+        self.difficulty = data[offset + 1:offset + 1 + length].decode()
+        offset += 1 + length
+        self.level_num, width, height, grid_size = struct.unpack_from('<HHHI', data, offset)
+        offset += 10
+        grid = zlib.decompress(data[offset:offset + grid_size]).decode('ascii')
+        self.level = [list(grid[y * width:(y + 1) * width]) for y in range(height)]
+        offset += grid_size
+        count, = struct.unpack_from('<H', data, offset)
+        self.snake_coords = [struct.unpack_from('<HH', data, offset + 2 + 4 * i) for i in range(count)]
+        offset += 2 + 4 * count
+        turns_count, turns_size = struct.unpack_from('<II', data, offset)
+        offset += 8
+        self.turns = []
+        tick = 0
+        position = offset
+        for _ in range(turns_count):
+            delta, position = read_varint(data, position)
+            tick += delta
+            self.turns.append((tick, data[position]))
+            position += 1
+        offset += turns_size
+        self.ticks, self.score, self.length, status, self.digest = FOOTER.unpack_from(data, offset)
+        self.status = STATUSES[status]
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename, 'rb') as file:
+            return cls(file.read())
+
+    def actions(self):
+        # направление или None для каждого хода
+        actions = [None] * self.ticks
+        for tick, direction in self.turns:
+            actions[tick] = direction
+        return actions
+
+    def play(self):
+        # повторяет партию, возвращает Engine в конце
+        game = Engine(self.level, self.seed, self.snake_coords)
+        for action in self.actions():
+            game.step(action)
+        return game
+
+    def mismatches(self, game):
+        # расхождения итога воспроизведения с записанным
+        expected = {'ходов': self.ticks, 'счёт': self.score, 'длина': self.length,
+                    'статус': self.status, 'змейка': self.digest}
+        actual = {'ходов': game.ticks, 'счёт': game.snake.score, 'длина': len(game.snake.snake_coords),
+                  'статус': game.status, 'змейка': snake_digest(game.snake)}
+        return [(name, expected[name], actual[name]) for name in expected if expected[name] != actual[name]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Воспроизведение записанных игр без окна с проверкой итога')
+    parser.add_argument('files', nargs='+', help='файлы записей .rpl')
+    args = parser.parse_args()
+    failed = 0
+    for filename in args.files:
+        replay = Replay.load(filename)
+        start = time.perf_counter()
+        game = replay.play()
+        work_time = time.perf_counter() - start
+        mismatches = replay.mismatches(game)
+        speed = replay.ticks / work_time if work_time else 0
+        print(f'{filename}: {replay.difficulty} {replay.level_num}, {replay.ticks} ходов, счёт {game.snake.score}, '
+              f'{speed:.0f} ходов/с - {"РАСХОЖДЕНИЕ" if mismatches else "совпадает"}')
+        for name, expected, actual in mismatches:
+            print(f'  {name}: записано {expected}, получено {actual}')
+        failed += bool(mismatches)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()